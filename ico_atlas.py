@@ -0,0 +1,303 @@
+"""Sprite sheet / atlas slicing: python pngtoico.py atlas <sheet.png> ...
+
+The sheet is decoded exactly once, into a shared-memory RGBA buffer.
+Worker processes map that buffer without copying it (Image.frombuffer),
+so a cell's pixels are only copied out when that cell is resized.
+Fully transparent cells are found up front, on NumPy views of the shared
+buffer when NumPy is installed, and never reach the pool. Cells come from
+a regular grid or from a JSON manifest.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+from PIL import Image, UnidentifiedImageError
+
+import ico_core
+from ico_metrics import log, setup_logging, span
+from ico_resize import RESIZE_MODES, RESIZE_QUALITY, normalize_mode
+
+try:
+    import numpy as np
+except ImportError: # Optional: only used to scan for empty cells without copying
+    np = None
+
+
+# --- Cell layout ---
+def parse_grid(spec):
+    """Parses 'COLSxROWS' (or a cell size 'WxH') into a pair of positive ints."""
+    try:
+        first, second = map(int, spec.lower().split('x'))
+    except ValueError:
+        raise ValueError(f"Invalid grid '{spec}', expected e.g. 8x4")
+    if first <= 0 or second <= 0:
+        raise ValueError(f"Invalid grid '{spec}', both numbers must be positive")
+    return first, second
+
+
+def grid_cells(sheet_path, sheet_size, columns=None, rows=None, cell_size=None, margin=0, spacing=0):
+    """Lays out a regular grid. Returns [(name, (left, top, right, bottom))].
+
+    Give either `columns`/`rows` (cell size is derived from the sheet) or
+    `cell_size` (as many whole cells as fit). `margin` is the border around
+    the sheet and `spacing` the gap between cells, in pixels. Cells are
+    named '<sheet>_r<row>_c<col>' so each ICO follows the usual naming.
+    """
+    width, height = sheet_size
+    inner_w, inner_h = width - 2 * margin, height - 2 * margin
+    if cell_size:
+        cell_w, cell_h = cell_size
+        columns = (inner_w + spacing) // (cell_w + spacing)
+        rows = (inner_h + spacing) // (cell_h + spacing)
+    else:
+        cell_w = (inner_w - spacing * (columns - 1)) // columns
+        cell_h = (inner_h - spacing * (rows - 1)) // rows
+    if cell_w <= 0 or cell_h <= 0 or columns <= 0 or rows <= 0:
+        raise ValueError(f"Grid does not fit a {width}x{height} sheet")
+
+    base_name = os.path.splitext(os.path.basename(sheet_path))[0]
+    cells = []
+    for row in range(rows):
+        top = margin + row * (cell_h + spacing)
+        for col in range(columns):
+            left = margin + col * (cell_w + spacing)
+            cells.append((f"{base_name}_r{row}_c{col}.png", (left, top, left + cell_w, top + cell_h)))
+    return cells
+
+
+def load_manifest(manifest_path, sheet_size):
+    """Reads cell rectangles from JSON. Returns [(name, (left, top, right, bottom))].
+
+    Accepted layouts: a list (or {"cells": [...]}) of {"name", "x", "y",
+    "w", "h"} objects, and TexturePacker-style {"frames": ...} exports in
+    either the hash or the array flavour. Rotated frames are rejected.
+    """
+    with open(manifest_path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "frames" in data:
+        frames = data["frames"]
+        if isinstance(frames, dict):
+            frames = [dict(entry, filename=name) for name, entry in frames.items()]
+        entries = []
+        for entry in frames:
+            if entry.get("rotated"):
+                raise ValueError(f"Rotated frame '{entry.get('filename')}' is not supported")
+            entries.append(dict(entry["frame"], name=entry.get("filename")))
+    else:
+        entries = data["cells"] if isinstance(data, dict) else data
+
+    width, height = sheet_size
+    cells = []
+    for index, entry in enumerate(entries):
+        try:
+            x, y, w, h = (int(entry[key]) for key in ("x", "y", "w", "h"))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Manifest cell {index} needs integer x, y, w and h")
+        if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > width or y + h > height:
+            raise ValueError(f"Manifest cell {index} lies outside the {width}x{height} sheet")
+        # Nested names ('ui/save.png') become flat file names ('ui_save.png')
+        name = str(entry.get("name") or f"cell_{index}").replace("\\", "/").strip("/").replace("/", "_")
+        cells.append((name, (x, y, x + w, y + h)))
+    return cells
+
+
+def output_names(cells, name_suffix):
+    """Maps each cell to its ICO file name, refusing names that would collide."""
+    names = {}
+    for name, _box in cells:
+        ico_name = ico_core.ico_filename_for(name, name_suffix)
+        if ico_name in names.values():
+            raise ValueError(f"Two cells would both be written to {ico_name}")
+        names[name] = ico_name
+    return names
+
+
+# --- Shared sheet ---
+class SharedSheet:
+    """A decoded sheet held in shared memory, as RGBA or RGBX (no alpha)."""
+
+    def __init__(self, sheet_path):
+        with span("decode"):
+            try:
+                image = Image.open(sheet_path)
+            except UnidentifiedImageError:
+                raise ValueError("Selected file is not a valid PNG.")
+            if image.format != 'PNG':
+                image.close()
+                raise ValueError("Selected file is not a valid PNG.")
+            image = normalize_mode(image)
+            # RGBX keeps 4 bytes per pixel, which is what frombuffer can map
+            self.mode = "RGBA" if image.mode == "RGBA" else "RGBX"
+            self.size = image.size
+            data = image.tobytes("raw", self.mode)
+            del image
+        self.shm = shared_memory.SharedMemory(create=True, size=len(data))
+        self.shm.buf[:len(data)] = data
+        del data
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def blank_cells(self, cells):
+        """Names of the cells whose alpha is zero everywhere."""
+        if self.mode != "RGBA":
+            return set()
+        width, height = self.size
+        if np is not None:
+            # A view straight onto the shared buffer; slicing copies nothing
+            alpha = np.ndarray((height, width, 4), np.uint8, buffer=self.shm.buf)[..., 3]
+            blank = {name for name, (left, top, right, bottom) in cells
+                     if not alpha[top:bottom, left:right].any()}
+            del alpha # Must not outlive the buffer it points into
+            return blank
+        sheet = map_sheet(self.shm, self.mode, self.size)
+        alpha = sheet.getchannel("A")
+        del sheet
+        return {name for name, box in cells if alpha.crop(box).getbbox() is None}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def map_sheet(shm, mode, size):
+    """Wraps the shared buffer in a read-only Image without copying the pixels."""
+    return Image.frombuffer(mode, size, shm.buf, "raw", mode, 0, 1)
+
+
+_worker_sheet = None # (SharedMemory, Image) mapped once per worker by _init_worker
+
+
+def _init_worker(shm_name, mode, size):
+    """Pool initializer: maps the shared sheet once per process."""
+    global _worker_sheet
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_sheet = (shm, map_sheet(shm, mode, size))
+
+
+def _convert_cell(name, box, ico_path, ico_sizes, resize_mode, frame_formats):
+    """Worker entry point: crops one cell out of the shared sheet and writes its ICO."""
+    cell = _worker_sheet[1].crop(box)
+    if cell.mode == "RGBX":
+        cell = cell.convert("RGB")
+    ico_core.save_ico(cell, ico_path, ico_sizes, resize_mode, frame_formats=frame_formats)
+    return name, ico_path, os.path.getsize(ico_path)
+
+
+def run_atlas(sheet_path, cells_for, output_dir=None, size_str=ico_core.DEFAULT_ICON_SIZE,
+              all_sizes=False, workers=None, resize_mode=RESIZE_QUALITY, frame_formats=None,
+              keep_empty=False, report=print):
+    """Writes one ICO per cell of `sheet_path`. Returns (ok_count, failures, skipped, elapsed).
+
+    `cells_for(sheet_size)` returns the [(name, box)] layout (see
+    grid_cells and load_manifest); it runs after the single decode, once
+    the sheet size is known. `output_dir=None`
+    writes next to the sheet. Fully transparent cells are skipped unless
+    `keep_empty` is set.
+    """
+    ico_sizes, name_suffix = ico_core.resolve_sizes(size_str, all_sizes)
+    output_dir = output_dir or os.path.dirname(os.path.abspath(sheet_path))
+    start = time.perf_counter()
+    sheet = SharedSheet(sheet_path)
+    try:
+        cells = cells_for(sheet.size)
+        ico_names = output_names(cells, name_suffix)
+        skipped = set() if keep_empty else sheet.blank_cells(cells)
+        todo = [(name, box) for name, box in cells if name not in skipped]
+        log.debug(f"{len(cells)} cells, {len(skipped)} empty, {len(todo)} to convert")
+
+        ok_count = 0
+        failures = []
+        workers = min(workers or os.cpu_count() or 1, max(len(todo), 1))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(sheet.name, sheet.mode, sheet.size)) as pool:
+            futures = {
+                pool.submit(_convert_cell, name, box, os.path.join(output_dir, ico_names[name]),
+                            ico_sizes, resize_mode, frame_formats): name
+                for name, box in todo
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    _, ico_path, _size = future.result()
+                except Exception as e:
+                    failures.append((name, e))
+                    report(f"FAIL {name}: {e}")
+                else:
+                    ok_count += 1
+                    report(f"OK   {name} -> {ico_path}")
+    finally:
+        sheet.close()
+
+    elapsed = time.perf_counter() - start
+    report(f"Wrote {ok_count}/{len(todo)} ICOs from {len(cells)} cells in {elapsed:.2f}s "
+           f"({len(skipped)} empty cells skipped)")
+    return ok_count, failures, len(skipped), elapsed
+
+
+# --- Command line ---
+def build_parser():
+    """Builds the argument parser for the atlas sub-command."""
+    parser = argparse.ArgumentParser(
+        prog="pngtoico.py atlas",
+        description="Slice a sprite sheet PNG into one ICO per cell.")
+    parser.add_argument("sheet", help="Sprite sheet / atlas PNG")
+    layout = parser.add_mutually_exclusive_group(required=True)
+    layout.add_argument("--grid", metavar="COLSxROWS", help="Split the sheet into a COLS x ROWS grid")
+    layout.add_argument("--cell", metavar="WxH", help="Split the sheet into WxH pixel cells")
+    layout.add_argument("--manifest", metavar="FILE",
+                        help="JSON cell list ({name, x, y, w, h}) or TexturePacker export")
+    parser.add_argument("--margin", type=int, default=0, help="Border around the grid in pixels")
+    parser.add_argument("--spacing", type=int, default=0, help="Gap between grid cells in pixels")
+    parser.add_argument("-o", "--output", help="Output folder (default: next to the sheet)")
+    parser.add_argument("-s", "--size", default=ico_core.DEFAULT_ICON_SIZE, choices=ico_core.ICON_SIZES,
+                        help=f"Single ICO size (default: {ico_core.DEFAULT_ICON_SIZE})")
+    parser.add_argument("-a", "--all-sizes", action="store_true",
+                        help="Generate all common sizes (16x16 to 256x256) in each ICO")
+    parser.add_argument("--resize", default=RESIZE_QUALITY, choices=RESIZE_MODES,
+                        help="Resize pyramid mode (see 'pngtoico.py batch --help')")
+    parser.add_argument("--frame-format", action="append", metavar="SIZE=FMT",
+                        help="Store a frame size as png or bmp, e.g. 48x48=png; repeatable")
+    parser.add_argument("--keep-empty", action="store_true",
+                        help="Also convert fully transparent cells")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point. Returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    try:
+        if args.manifest:
+            def cells_for(sheet_size):
+                return load_manifest(args.manifest, sheet_size)
+        else:
+            columns = rows = cell_size = None
+            if args.grid:
+                columns, rows = parse_grid(args.grid)
+            else:
+                cell_size = parse_grid(args.cell)
+
+            def cells_for(sheet_size):
+                return grid_cells(args.sheet, sheet_size, columns, rows, cell_size,
+                                  args.margin, args.spacing)
+        frame_formats = ico_core.parse_frame_formats(args.frame_format)
+        _, failures, _, _ = run_atlas(args.sheet, cells_for, args.output, args.size, args.all_sizes,
+                                      args.workers, args.resize, frame_formats, args.keep_empty)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""Headless batch conversion: python pngtoico.py batch <inputs...>
+
+Spreads decode/resize/encode across a process pool while keeping only a
+bounded number of files in flight.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import ico_core
+from ico_cache import DEFAULT_MAX_BYTES, ConversionCache, default_cache_dir
+from ico_metrics import METRICS, METRICS_FORMATS, FORMAT_PROMETHEUS, configure, setup_logging
+from ico_optimize import DEFAULT_MAX_ERROR, DEFAULT_TIME_BUDGET, Optimizer
+from ico_resize import RESIZE_MODES, RESIZE_QUALITY
+
+
+def collect_inputs(inputs, recursive=False, extension='.png'):
+    """Expands files and directories on the command line into a list of PNG (or `extension`) paths."""
+    for entry in inputs:
+        if os.path.isdir(entry):
+            if recursive:
+                for root, _dirs, files in os.walk(entry):
+                    for name in sorted(files):
+                        if name.lower().endswith(extension):
+                            yield os.path.join(root, name)
+            else:
+                for name in sorted(os.listdir(entry)):
+                    path = os.path.join(entry, name)
+                    if name.lower().endswith(extension) and os.path.isfile(path):
+                        yield path
+        else:
+            yield entry
+
+
+_worker_cache = None     # One ConversionCache per worker process, set by _init_worker
+_worker_optimizer = None # Likewise for the Optimizer when --optimize is given
+
+
+def _init_worker(cache_dir, cache_max_bytes, cache_hardlink, metrics_enabled, optimize=None):
+    """Pool initializer: opens the shared conversion cache once per process.
+
+    `optimize` is None or (max_error, time_budget) for an Optimizer.
+    """
+    global _worker_cache, _worker_optimizer
+    if cache_dir:
+        _worker_cache = ConversionCache(cache_dir, cache_max_bytes, cache_hardlink)
+    if optimize is not None:
+        # Processes already use every core; one trial thread each is enough
+        _worker_optimizer = Optimizer(*optimize, max_workers=1)
+    # Workers only record; their metrics travel back with each result
+    METRICS.enabled = metrics_enabled
+
+
+def _convert_one(png_path, output_dir, size_str, all_sizes, resize_mode, frame_formats,
+                 profile_path=None):
+    """Worker entry point.
+
+    Returns (png_path, ico_path, bytes_in, bytes_out, cache_hit, saved, metrics)
+    where `saved` is what the optimizer shaved off this file and `metrics`
+    is this worker's METRICS.drain() snapshot.
+    """
+    hits_before = _worker_cache.hits if _worker_cache else 0
+    saved_before = _worker_optimizer.bytes_saved if _worker_optimizer else 0
+    METRICS.profile_path = profile_path
+    try:
+        ico_path = ico_core.convert_file(png_path, output_dir, size_str, all_sizes, resize_mode,
+                                         _worker_cache, frame_formats, optimizer=_worker_optimizer)
+    except Exception as e:
+        # Ship the snapshot with the error so stage timings are not lost
+        e.metrics = METRICS.drain() if METRICS.enabled else None
+        raise
+    cache_hit = bool(_worker_cache) and _worker_cache.hits > hits_before
+    saved = _worker_optimizer.bytes_saved - saved_before if _worker_optimizer else 0
+    metrics = METRICS.drain() if METRICS.enabled else None
+    return (png_path, ico_path, os.path.getsize(png_path), os.path.getsize(ico_path),
+            cache_hit, saved, metrics)
+
+
+def _convert_group(png_paths, output_dir, size_str, all_sizes, resize_mode, frame_formats,
+                   profile_path=None):
+    """Worker entry point for --group: converts several files with one batched resize.
+
+    Returns (items, saved, metrics) where each item is (png_path, ico_path,
+    bytes_in, bytes_out, cache_hit) or the exception that file failed with,
+    and `saved` is what the optimizer shaved off the whole group.
+    """
+    saved_before = _worker_optimizer.bytes_saved if _worker_optimizer else 0
+    METRICS.profile_path = profile_path
+    with METRICS.maybe_profile():
+        results = ico_core.convert_files(png_paths, output_dir, size_str, all_sizes, resize_mode,
+                                         _worker_cache, frame_formats, _worker_optimizer)
+    items = []
+    for png_path, result in zip(png_paths, results):
+        if isinstance(result, Exception):
+            items.append(result)
+        else:
+            ico_path, cache_hit = result
+            items.append((png_path, ico_path, os.path.getsize(png_path), os.path.getsize(ico_path),
+                          cache_hit))
+    saved = _worker_optimizer.bytes_saved - saved_before if _worker_optimizer else 0
+    return items, saved, METRICS.drain() if METRICS.enabled else None
+
+
+def run_batch(paths, output_dir=None, size_str=ico_core.DEFAULT_ICON_SIZE, all_sizes=False,
+              workers=None, max_in_flight=None, resize_mode=RESIZE_QUALITY,
+              cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, cache_hardlink=False,
+              frame_formats=None, profile_path=None, optimize=None, report=print,
+              output_dir_for=None, on_success=None, group=1):
+    """Converts `paths` in a process pool. Returns (ok_count, failures, elapsed_seconds).
+
+    `output_dir=None` writes each ICO next to its source. At most
+    `max_in_flight` files are submitted to the pool at any time so memory
+    stays bounded no matter how many inputs there are. `cache_dir` enables
+    the shared content-addressed ConversionCache. Worker metrics are merged
+    into this process's METRICS when it is enabled, and `profile_path`
+    cProfiles the first conversion. `optimize=(max_error, time_budget)`
+    runs every file through an ico_optimize.Optimizer.
+    `output_dir_for(png_path)`, if given, picks each file's output folder
+    instead of `output_dir`, and `on_success(png_path, ico_path)` is called
+    for every file converted. With `group` > 1 each task carries up to that
+    many files for the same output folder, resized together through
+    ico_resample (same-size sources become one stack); `max_in_flight` then
+    counts groups.
+    """
+    # Validate the size options once up front rather than once per file
+    ico_core.resolve_sizes(size_str, all_sizes)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+
+    ok_count = 0
+    failures = []
+    bytes_in = bytes_out = 0
+    cache_hits = 0
+    bytes_saved = 0
+    start = time.perf_counter()
+    path_iter = iter(paths)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache_dir, cache_max_bytes, cache_hardlink,
+                                       METRICS.enabled, optimize)) as pool:
+        pending = {}
+        profile_next = [profile_path]
+        held = [] # A path read ahead that belongs to the next group
+
+        def submit_next():
+            batch = []
+            target_dir = None
+            while len(batch) < group:
+                png_path = held.pop() if held else next(path_iter, None)
+                if png_path is None:
+                    break
+                if output_dir_for is not None:
+                    path_dir = output_dir_for(png_path)
+                else:
+                    path_dir = output_dir or os.path.dirname(os.path.abspath(png_path))
+                if batch and path_dir != target_dir:
+                    held.append(png_path) # A group only ever writes to one folder
+                    break
+                batch.append(png_path)
+                target_dir = path_dir
+            if not batch:
+                return False
+            if group > 1:
+                future = pool.submit(_convert_group, batch, target_dir, size_str, all_sizes,
+                                     resize_mode, frame_formats, profile_next[0])
+            else:
+                future = pool.submit(_convert_one, batch[0], target_dir, size_str, all_sizes,
+                                     resize_mode, frame_formats, profile_next[0])
+            profile_next[0] = None # Only the first conversion (or group) is profiled
+            pending[future] = batch
+            return True
+
+        def failed(png_path, e):
+            METRICS.count_error(e)
+            failures.append((png_path, e))
+            report(f"FAIL {png_path}: {e}")
+
+        def converted(png_path, ico_path, size_in, size_out, cache_hit, saved=0):
+            nonlocal ok_count, bytes_in, bytes_out, cache_hits, bytes_saved
+            ok_count += 1
+            bytes_in += size_in
+            bytes_out += size_out
+            cache_hits += cache_hit
+            bytes_saved += saved
+            note = " (cached)" if cache_hit else f" (-{saved / 1e3:.1f} KB)" if saved else ""
+            report(f"OK   {png_path} -> {ico_path}{note}")
+            if on_success is not None:
+                on_success(png_path, ico_path)
+
+        while len(pending) < max_in_flight and submit_next():
+            pass
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = pending.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    METRICS.merge(getattr(e, "metrics", None))
+                    for png_path in batch:
+                        failed(png_path, e)
+                else:
+                    if group > 1:
+                        items, saved, metrics = outcome
+                        METRICS.merge(metrics)
+                        # Savings are only known per group, so they go into the totals
+                        bytes_saved += saved
+                        for png_path, item in zip(batch, items):
+                            if isinstance(item, Exception):
+                                failed(png_path, item)
+                            else:
+                                converted(*item)
+                    else:
+                        METRICS.merge(outcome[-1])
+                        converted(*outcome[:-1])
+                submit_next()
+
+    elapsed = time.perf_counter() - start
+    total = ok_count + len(failures)
+    rate = total / elapsed if elapsed > 0 else 0.0
+    report(f"Converted {ok_count}/{total} files in {elapsed:.2f}s "
+           f"({rate:.1f} files/s, {bytes_in / 1e6:.1f} MB in, {bytes_out / 1e6:.1f} MB out)")
+    if cache_dir:
+        report(f"Cache: {cache_hits} hits, {ok_count - cache_hits} misses")
+    if optimize is not None:
+        before = bytes_out + bytes_saved
+        ratio = bytes_saved / before if before else 0.0
+        report(f"Optimizer: saved {bytes_saved / 1e3:.1f} KB of {before / 1e3:.1f} KB ({ratio:.1%})")
+    return ok_count, failures, elapsed
+
+
+def build_parser():
+    """Builds the argument parser for the batch sub-command."""
+    parser = argparse.ArgumentParser(
+        prog="pngtoico.py batch",
+        description="Convert PNG files to ICO without opening the GUI.")
+    parser.add_argument("inputs", nargs="+", help="PNG files or folders containing PNG files")
+    parser.add_argument("-o", "--output", help="Output folder (default: next to each source)")
+    parser.add_argument("-s", "--size", default=ico_core.DEFAULT_ICON_SIZE, choices=ico_core.ICON_SIZES,
+                        help=f"Single ICO size (default: {ico_core.DEFAULT_ICON_SIZE})")
+    parser.add_argument("-a", "--all-sizes", action="store_true",
+                        help="Generate all common sizes (16x16 to 256x256) in one ICO")
+    parser.add_argument("--resize", default=RESIZE_QUALITY, choices=RESIZE_MODES,
+                        help="Resize pyramid mode: 'quality' stays close to direct LANCZOS, "
+                             "'fast' chains every frame from the next larger one")
+    parser.add_argument("--frame-format", action="append", metavar="SIZE=FMT",
+                        help="Store a frame size as png or bmp, e.g. 48x48=png "
+                             "(default: png for 256px, bmp below); repeatable")
+    parser.add_argument("--cache", metavar="DIR", nargs="?", const="",
+                        help="Reuse results from a conversion cache (default folder if DIR omitted)")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Cache size budget before LRU eviction (default: %(default)s)")
+    parser.add_argument("--cache-hardlink", action="store_true",
+                        help="Hardlink cache hits into the output folder instead of copying")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Try several encodings per frame and keep the smallest")
+    parser.add_argument("--max-error", type=float, default=DEFAULT_MAX_ERROR,
+                        help="Largest error any pixel of an optimized frame may get, in 0-255 levels "
+                             "(default: %(default)s = lossless)")
+    parser.add_argument("--optimize-time", type=float, default=DEFAULT_TIME_BUDGET,
+                        help="Seconds the optimizer may spend per file (default: %(default)s)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="Write per-stage timings and counters to FILE")
+    parser.add_argument("--metrics-format", choices=METRICS_FORMATS, default=FORMAT_PROMETHEUS,
+                        help="Metrics file format (default: %(default)s)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="cProfile the first conversion and write the stats to FILE")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Descend into sub-folders")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Files (or groups) queued to the pool at once (default: 2 x workers)")
+    parser.add_argument("--group", type=int, default=1, metavar="N",
+                        help="Resize up to N files per task together; same-size sources are "
+                             "stacked and resized as matrix products when NumPy is installed")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point. Returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    configure(args.metrics, args.metrics_format, profile_path=None,
+              enabled=bool(args.metrics or args.profile))
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    paths = collect_inputs(args.inputs, recursive=args.recursive)
+    cache_dir = None
+    if args.cache is not None:
+        cache_dir = args.cache or default_cache_dir()
+    try:
+        frame_formats = ico_core.parse_frame_formats(args.frame_format)
+        _, failures, _ = run_batch(paths, args.output, args.size, args.all_sizes,
+                                   args.workers, args.max_in_flight, args.resize,
+                                   cache_dir, args.cache_max_mb * 1024 * 1024, args.cache_hardlink,
+                                   frame_formats, args.profile,
+                                   (args.max_error, args.optimize_time) if args.optimize else None,
+                                   group=max(args.group, 1))
+    except ValueError as ve:
+        print(f"Error: {ve}", file=sys.stderr)
+        return 2
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,462 @@
+"""Reproducible benchmarks for the conversion pipeline.
+
+    python ico_bench.py run -o results.json [--quick]
+    python ico_bench.py compare baseline.json results.json [--threshold 0.1]
+    python ico_bench.py startup [--budget-ms 150]
+    python ico_bench.py resample [--edge 1024 --count 16]
+    python ico_bench.py cache
+    python ico_bench.py quality [--edges 256 1024 4096]
+
+`run` generates a deterministic synthetic PNG corpus (16px to 8192px,
+RGBA/RGB/paletted, photographic and flat content), then runs
+ico_core.convert_file for each size in ICON_SIZES and for the all-sizes
+mode, timing it end to end and per stage (decode, resize, encode, write)
+from the spans it records through ico_metrics. `compare` flags any
+timing that got slower than the baseline by more than the threshold.
+`startup` measures cold import times with `python -X importtime` and
+fails if a module loads something it must not (Tk in the core, ttkthemes
+before the GUI window is shown). `resample` compares the per-image Pillow
+pyramid with ico_resample's batched NumPy backend on a stack of same-size
+images. `cache` checks that ConversionCache entries survive their outputs
+being converted again, with copies and with hardlinks. `quality` checks
+every pyramid frame against a direct LANCZOS resize of the source and
+fails if quality mode exceeds QUALITY_MAX_ERROR.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import PIL
+from PIL import Image, ImageDraw
+
+import ico_core
+from ico_cache import ConversionCache
+from ico_file import file_mode
+from ico_metrics import METRICS
+import ico_resample
+from ico_resize import (QUALITY_MAX_ERROR, RESIZE_FAST, RESIZE_MODES, RESIZE_QUALITY, build_frames,
+                        normalize_mode, visible_error)
+
+CORPUS_EDGES = [16, 64, 256, 1024, 4096, 8192]
+QUICK_EDGES = [16, 256, 1024]
+CORPUS_MODES = ["RGBA", "RGB", "P"]
+CORPUS_CONTENT = ["photo", "flat"]
+ALL_SIZES_TARGET = ico_core.ALL_SIZES_SUFFIX
+STAGES = ["decode", "resize", "encode", "write", "total"]
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "pngtoico_bench_corpus")
+CORPUS_VERSION = 1 # Bump whenever the generators below change
+GUI_MODULES = ("tkinter", "PIL.ImageTk", "ttkthemes")
+# Module -> modules it must not import at load time
+STARTUP_CHECKS = {
+    "pngtoico": GUI_MODULES,
+    "ico_core": GUI_MODULES,
+    "ico_batch": GUI_MODULES,
+    "ico_server": GUI_MODULES,
+    "ico_gui": ("PIL.ImageTk", "ttkthemes", "webbrowser", "ico_build", "ico_watch"),
+}
+
+
+# --- Corpus ---
+def _smooth_noise(edge, seed, cells=32):
+    """Deterministic low-frequency noise: seeded bytes upscaled with BICUBIC."""
+    cells = min(cells, edge)
+    data = random.Random(seed).randbytes(cells * cells)
+    return Image.frombytes("L", (cells, cells), data).resize((edge, edge), Image.Resampling.BICUBIC)
+
+
+def _fine_noise(edge, seed):
+    """Deterministic per-pixel grain, generated at 1/4 resolution to stay cheap."""
+    small = max(edge // 4, 1)
+    data = random.Random(seed).randbytes(small * small)
+    return Image.frombytes("L", (small, small), data).resize((edge, edge), Image.Resampling.NEAREST)
+
+
+def make_image(edge, mode, content):
+    """Builds one synthetic corpus image. Same arguments always give the same pixels."""
+    seed = f"{CORPUS_VERSION}-{edge}-{mode}-{content}"
+    if content == "photo":
+        # Smooth colour fields plus fine grain, roughly like a photo
+        grain = _fine_noise(edge, seed + "g")
+        bands = [Image.blend(_smooth_noise(edge, seed + c), grain, 0.25) for c in "rgb"]
+        image = Image.merge("RGB", bands)
+        alpha = _smooth_noise(edge, seed + "a", cells=4).point(lambda v: 255 if v > 64 else v * 4)
+    else:
+        # Flat icon-like artwork: a few solid shapes on a transparent field
+        image = Image.new("RGB", (edge, edge), (255, 255, 255))
+        alpha = Image.new("L", (edge, edge), 0)
+        draw, draw_alpha = ImageDraw.Draw(image), ImageDraw.Draw(alpha)
+        rng = random.Random(seed)
+        for _ in range(6):
+            x0, y0 = rng.randrange(edge), rng.randrange(edge)
+            box = [x0, y0, x0 + rng.randrange(edge // 2 + 1), y0 + rng.randrange(edge // 2 + 1)]
+            colour = tuple(rng.randrange(256) for _ in range(3))
+            draw.ellipse(box, fill=colour)
+            draw_alpha.ellipse(box, fill=255)
+    if mode == "RGBA":
+        image.putalpha(alpha)
+        return image
+    if mode == "P":
+        return image.quantize(colors=256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+    return image
+
+
+def ensure_corpus(corpus_dir, edges):
+    """Writes any missing corpus PNGs to `corpus_dir`. Returns [(name, path)]."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    entries = []
+    for edge in edges:
+        for mode in CORPUS_MODES:
+            for content in CORPUS_CONTENT:
+                name = f"v{CORPUS_VERSION}_{mode.lower()}_{content}_{edge}"
+                path = os.path.join(corpus_dir, f"{name}.png")
+                if not os.path.exists(path):
+                    print(f"Generating {name}.png")
+                    make_image(edge, mode, content).save(path, format="PNG")
+                entries.append((name, path))
+    return entries
+
+
+def corpus_digest(entries):
+    """SHA-256 over every corpus file, recorded so results are only compared like for like."""
+    digest = hashlib.sha256()
+    for name, path in entries:
+        digest.update(name.encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# --- Timing ---
+def _time_stages(png_path, size_str, out_dir):
+    """Runs ico_core.convert_file once, returning {stage: seconds}.
+
+    The stages are the spans the conversion path records itself, so a stage
+    it skips (e.g. resize and write when Pillow's fallback encodes) is absent.
+    """
+    METRICS.drain()
+    start = time.perf_counter()
+    ico_core.convert_file(png_path, out_dir, size_str, all_sizes=size_str == ALL_SIZES_TARGET)
+    total = time.perf_counter() - start
+    _counters, stages = METRICS.drain()
+    timings = {stage: stages[stage][1] for stage in STAGES if stage in stages}
+    timings["total"] = total
+    return timings
+
+
+def run_benchmarks(entries, repeats=3, report=print):
+    """Times every corpus image for each ICON_SIZES entry and the all-sizes mode."""
+    targets = list(ico_core.ICON_SIZES) + [ALL_SIZES_TARGET]
+    results = []
+    was_enabled, METRICS.enabled = METRICS.enabled, True # Turns the stage spans on
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            if entries:
+                # Warm-up: plugin registration and thread pool start-up are one-off costs
+                _time_stages(entries[0][1], targets[-1], out_dir)
+            for name, path in entries:
+                for target in targets:
+                    results.extend(_time_target(name, path, target, out_dir, repeats, report))
+    finally:
+        METRICS.enabled = was_enabled
+    return results
+
+
+def _time_target(name, path, target, out_dir, repeats, report):
+    """Result rows (median and best of `repeats`) for one image and target."""
+    samples = {stage: [] for stage in STAGES}
+    for _ in range(repeats):
+        for stage, seconds in _time_stages(path, target, out_dir).items():
+            samples[stage].append(seconds)
+    results = []
+    for stage in STAGES:
+        if not samples[stage]:
+            continue
+        results.append({
+            "image": name,
+            "target": target,
+            "stage": stage,
+            "median_s": statistics.median(samples[stage]),
+            "min_s": min(samples[stage]),
+            "repeats": repeats,
+        })
+    total_ms = statistics.median(samples["total"]) * 1000
+    report(f"{name:<28} {target:<10} {total_ms:9.2f} ms")
+    return results
+
+
+def environment():
+    """Machine/library details stored with every result file."""
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+# --- Startup ---
+def import_times(module, python=sys.executable):
+    """Imports `module` in a fresh interpreter. Returns {name: (self_us, cumulative_us)}."""
+    proc = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.strip()}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def startup_report(checks=STARTUP_CHECKS, repeats=5, top=5, report=print):
+    """Times each module's cold import (best of `repeats`) and lists forbidden imports.
+
+    Returns [(module, best_ms, [forbidden modules that were imported])].
+    """
+    results = []
+    for module, forbidden in checks.items():
+        runs = [import_times(module) for _ in range(repeats)]
+        best = min(runs, key=lambda times: times[module][1])
+        best_ms = best[module][1] / 1000
+        loaded = [name for name in forbidden if name in best]
+        results.append((module, best_ms, loaded))
+        report(f"{module:<12} {best_ms:8.1f} ms" + (f"  FORBIDDEN: {', '.join(loaded)}" if loaded else ""))
+        heaviest = sorted((item for item in best.items() if item[0] != module),
+                          key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (own, _cumulative) in heaviest:
+            report(f"    {name:<32} {own / 1000:7.1f} ms self")
+    return results
+
+
+# --- Cache ---
+def cache_check(report=print):
+    """Converts through a fresh cache the way a user would and checks what comes back.
+
+    An output that is a hardlink of a cache entry is converted again from
+    changed pixels; the entry must still hold the old ICO. Hits must also
+    get the same permissions as a fresh conversion. Returns the problems found.
+    """
+    problems = []
+    for hardlink in (False, True):
+        label = "hardlink" if hardlink else "copy"
+        with tempfile.TemporaryDirectory() as root:
+            cache = ConversionCache(os.path.join(root, "cache"), hardlink=hardlink)
+            red, changed, out_dir = (os.path.join(root, name) for name in ("red.png", "a.png", "out"))
+            os.makedirs(out_dir)
+            Image.new("RGBA", (32, 32), (255, 0, 0, 255)).save(red)
+            Image.new("RGBA", (32, 32), (255, 0, 0, 255)).save(changed)
+            ico_core.convert_file(changed, out_dir, "32x32", cache=cache)     # miss, stored
+            ico_path = ico_core.convert_file(changed, out_dir, "32x32", cache=cache) # hit
+            if file_mode(ico_path) != file_mode():
+                problems.append(f"{label}: cache hit written with mode {file_mode(ico_path):o}, "
+                                f"not {file_mode():o}")
+            Image.new("RGBA", (32, 32), (0, 0, 255, 255)).save(changed)
+            ico_core.convert_file(changed, out_dir, "32x32", cache=cache)     # miss over the hit
+            hits = cache.hits
+            ico_path = ico_core.convert_file(red, out_dir, "32x32", cache=cache)
+            with Image.open(ico_path) as icon:
+                pixel = icon.convert("RGBA").getpixel((0, 0))
+            if cache.hits != hits + 1 or pixel != (255, 0, 0, 255):
+                problems.append(f"{label}: cache entry was overwritten through its output "
+                                f"(got {pixel} for a red source)")
+        report(f"{label:<8} {'ok' if not any(p.startswith(label) for p in problems) else 'FAILED'}")
+    return problems
+
+
+# --- Resize quality ---
+QUALITY_EDGES = [256, 1024, 4096]
+
+
+def pyramid_errors(edges=QUALITY_EDGES, report=print):
+    """visible_error of every all-sizes pyramid frame against LANCZOS straight from the source.
+
+    Covers every corpus mode and content at each edge. Returns
+    {resize mode: worst error}.
+    """
+    ico_sizes, _ = ico_core.resolve_sizes(ico_core.DEFAULT_ICON_SIZE, True)
+    worst = {mode: 0.0 for mode in RESIZE_MODES}
+    for edge in edges:
+        for image_mode in CORPUS_MODES:
+            for content in CORPUS_CONTENT:
+                image = normalize_mode(make_image(edge, image_mode, content))
+                errors = {}
+                for mode in RESIZE_MODES:
+                    errors[mode] = max((visible_error(frame, image.resize(frame.size, Image.Resampling.LANCZOS))
+                                        for frame in build_frames(image, ico_sizes, mode)), default=0.0)
+                    worst[mode] = max(worst[mode], errors[mode])
+                report(f"{edge:>5}px {image_mode:<4} {content:<6} quality {errors[RESIZE_QUALITY]:5.2f}   "
+                       f"fast {errors[RESIZE_FAST]:5.2f}")
+    return worst
+
+
+# --- Resize backends ---
+def compare_resample(edge=1024, count=16, repeats=3, report=print):
+    """Times build_frames per image against build_frames_batch on `count` images.
+
+    Returns [(resize mode, pillow ms/image, numpy ms/image, worst frame error)].
+    """
+    if not ico_resample.available():
+        raise ValueError("NumPy is not installed; the batched backend is unavailable.")
+    ico_sizes, _ = ico_core.resolve_sizes(ico_core.DEFAULT_ICON_SIZE, True)
+    images = [make_image(edge, "RGBA", CORPUS_CONTENT[index % len(CORPUS_CONTENT)])
+              for index in range(count)]
+    results = []
+    for mode in RESIZE_MODES:
+        ico_resample.build_frames_batch(images[:1], ico_sizes, mode) # Fill the weight cache
+        pillow = min(_timed(lambda: [build_frames(image, ico_sizes, mode) for image in images])
+                     for _ in range(repeats))
+        batched = min(_timed(lambda: ico_resample.build_frames_batch(images, ico_sizes, mode))
+                      for _ in range(repeats))
+        worst = max(visible_error(frame, reference)
+                    for frames, references in zip(ico_resample.build_frames_batch(images, ico_sizes, mode),
+                                                  [build_frames(image, ico_sizes, mode) for image in images])
+                    for frame, reference in zip(frames, references))
+        pillow_ms, numpy_ms = pillow / count * 1000, batched / count * 1000
+        results.append((mode, pillow_ms, numpy_ms, worst))
+        report(f"{mode:<8} pillow {pillow_ms:8.2f} ms/image   numpy {numpy_ms:8.2f} ms/image   "
+               f"x{pillow_ms / numpy_ms:.2f}   worst error {worst:.2f}")
+    return results
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+# --- Comparison ---
+def _result_key(result):
+    return f"{result['image']}/{result['target']}/{result['stage']}"
+
+
+def compare(baseline, current, threshold=0.10, min_delta_s=0.0005, stat="min_s"):
+    """Returns [(key, baseline_s, current_s, ratio)] for timings that regressed.
+
+    A timing regresses when its `stat` (best-of-N by default, the least
+    noisy choice) is more than `threshold` (as a fraction) slower than the
+    baseline and at least `min_delta_s` slower in absolute terms, which
+    keeps sub-millisecond jitter out of the report.
+    """
+    base = {_result_key(r): r[stat] for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = _result_key(result)
+        if key not in base:
+            continue
+        before, after = base[key], result[stat]
+        if after - before >= min_delta_s and after > before * (1 + threshold):
+            regressions.append((key, before, after, after / before if before else float("inf")))
+    return sorted(regressions, key=lambda r: r[3], reverse=True)
+
+
+# --- Command line ---
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the PNG to ICO conversion pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="Generate the corpus and time every stage")
+    run_cmd.add_argument("-o", "--output", default="bench_results.json", help="JSON file to write")
+    run_cmd.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="Folder for the synthetic PNG corpus")
+    run_cmd.add_argument("--repeats", type=int, default=3, help="Runs per measurement (median is reported)")
+    run_cmd.add_argument("--quick", action="store_true", help=f"Only edges {QUICK_EDGES}, one repeat")
+    run_cmd.add_argument("--edges", type=int, nargs="+", help="Explicit corpus edge lengths to use")
+
+    cmp_cmd = commands.add_parser("compare", help="Flag regressions against a baseline")
+    cmp_cmd.add_argument("baseline", help="Baseline JSON written by 'run'")
+    cmp_cmd.add_argument("current", help="New JSON written by 'run'")
+    cmp_cmd.add_argument("--threshold", type=float, default=0.10,
+                         help="Allowed slowdown as a fraction (default: 0.10 = 10%%)")
+    cmp_cmd.add_argument("--stat", choices=["min_s", "median_s"], default="min_s",
+                         help="Statistic to compare (default: min_s, best of the repeats)")
+
+    startup_cmd = commands.add_parser("startup", help="Check cold import times with -X importtime")
+    startup_cmd.add_argument("--repeats", type=int, default=5, help="Imports per module (best is reported)")
+    startup_cmd.add_argument("--top", type=int, default=5, help="Slowest dependencies listed per module")
+    startup_cmd.add_argument("--budget-ms", type=float, default=None,
+                             help="Also fail if any module takes longer than this to import")
+
+    resample_cmd = commands.add_parser("resample", help="Compare the Pillow and batched NumPy resize")
+    resample_cmd.add_argument("--edge", type=int, default=1024, help="Source edge length (default: %(default)s)")
+    resample_cmd.add_argument("--count", type=int, default=16, help="Images per stack (default: %(default)s)")
+    resample_cmd.add_argument("--repeats", type=int, default=3, help="Runs per backend (best is reported)")
+
+    commands.add_parser("cache", help="Check that cache entries are never overwritten through outputs")
+
+    quality_cmd = commands.add_parser("quality", help="Check pyramid frames against direct LANCZOS")
+    quality_cmd.add_argument("--edges", type=int, nargs="+", default=QUALITY_EDGES,
+                             help="Source edge lengths (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "run":
+        edges = args.edges or (QUICK_EDGES if args.quick else CORPUS_EDGES)
+        repeats = 1 if args.quick else args.repeats
+        Image.MAX_IMAGE_PIXELS = None # The 8192px corpus images are intentionally large
+        entries = ensure_corpus(args.corpus, edges)
+        results = run_benchmarks(entries, repeats)
+        payload = {"meta": dict(environment(), corpus=corpus_digest(entries), edges=edges),
+                   "results": results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=1)
+        print(f"Wrote {len(results)} timings to {args.output}")
+        return 0
+
+    if args.command == "resample":
+        try:
+            compare_resample(args.edge, args.count, args.repeats)
+        except ValueError as ve:
+            print(f"Error: {ve}", file=sys.stderr)
+            return 2
+        return 0
+
+    if args.command == "cache":
+        problems = cache_check()
+        for problem in problems:
+            print(f"FAIL {problem}")
+        return 1 if problems else 0
+
+    if args.command == "quality":
+        worst = pyramid_errors(args.edges)
+        failed = worst[RESIZE_QUALITY] > QUALITY_MAX_ERROR
+        print(f"worst error: quality {worst[RESIZE_QUALITY]:.2f} (bound {QUALITY_MAX_ERROR}), "
+              f"fast {worst[RESIZE_FAST]:.2f}" + ("  FAILED" if failed else ""))
+        return 1 if failed else 0
+
+    if args.command == "startup":
+        results = startup_report(repeats=args.repeats, top=args.top)
+        failed = [module for module, best_ms, loaded in results
+                  if loaded or (args.budget_ms is not None and best_ms > args.budget_ms)]
+        print(f"{len(failed)} module(s) failed the startup check" + (f": {', '.join(failed)}" if failed else ""))
+        return 1 if failed else 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    if baseline["meta"].get("corpus") != current["meta"].get("corpus"):
+        print("Warning: the two runs used different corpora; comparing matching keys only.")
+    regressions = compare(baseline, current, args.threshold, stat=args.stat)
+    for key, before, after, ratio in regressions:
+        print(f"REGRESSION {key:<50} {before * 1000:9.2f} ms -> {after * 1000:9.2f} ms  (x{ratio:.2f})")
+    print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
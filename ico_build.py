@@ -0,0 +1,295 @@
+"""Incremental folder-tree builds: python pngtoico.py build <source_dir> <output_dir>
+
+Every PNG under the source tree is converted into the same relative folder
+of the output tree. A manifest in the output folder records each source's
+mtime, size and content hash and the options it was converted with, so a
+rebuild only converts new or changed files and deletes the ICOs of sources
+that are gone. A file that was touched but not changed is recognised by
+its hash and not converted again. A rebuild with nothing to do costs two
+os.scandir walks and one JSON read.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+import ico_core
+from ico_batch import run_batch
+from ico_cache import CACHE_FORMAT_VERSION, DEFAULT_MAX_BYTES, ConversionCache, default_cache_dir
+from ico_file import write_atomic
+from ico_metrics import log, setup_logging
+from ico_optimize import DEFAULT_MAX_ERROR, DEFAULT_TIME_BUDGET, Optimizer
+from ico_resize import RESIZE_MODES, RESIZE_QUALITY
+
+MANIFEST_NAME = ".pngtoico-manifest.json"
+MANIFEST_VERSION = 1
+
+# `todo` is [(rel_source, mtime_ns, size, rel_output, digest)], with the digest
+# None unless the scan already had to hash the file; paths in the plan and
+# the manifest are relative to their root and always use '/' separators.
+BuildPlan = namedtuple("BuildPlan", "todo orphans unchanged")
+
+
+# --- Scanning ---
+def scan_tree(root, extension):
+    """Walks `root` with os.scandir. Returns {relative/path: DirEntry} of files ending in `extension`."""
+    found = {}
+    stack = [("", root)]
+    while stack:
+        rel_dir, path = stack.pop()
+        try:
+            entries = os.scandir(path)
+        except OSError:
+            if not rel_dir:
+                raise # The root itself must exist
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((f"{rel_dir}{entry.name}/", entry.path))
+                elif entry.name.lower().endswith(extension) and entry.is_file():
+                    found[rel_dir + entry.name] = entry
+    return found
+
+
+def file_hash(path):
+    """Content hash recorded in the manifest for each source."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def options_key(size_str, all_sizes, resize_mode, frame_formats, optimize):
+    """Short digest of everything that changes the output bytes."""
+    ico_sizes, _ = ico_core.resolve_sizes(size_str, all_sizes)
+    max_error = optimize[0] if optimize else None
+    options = (CACHE_FORMAT_VERSION, ico_sizes, resize_mode, sorted((frame_formats or {}).items()),
+               max_error)
+    return hashlib.blake2b(repr(options).encode(), digest_size=8).hexdigest()
+
+
+# --- Manifest ---
+class BuildManifest:
+    """{rel_source: {mtime_ns, size, hash, options, output}} stored as JSON in the output root."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning(f"Ignoring unreadable build manifest {path}: {e}")
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self.entries = data.get("entries", {})
+
+    def record(self, rel_source, mtime_ns, size, digest, options, rel_output):
+        self.entries[rel_source] = {"mtime_ns": mtime_ns, "size": size, "hash": digest,
+                                    "options": options, "output": rel_output}
+        self.dirty = True
+
+    def save(self):
+        """Writes the manifest atomically, and only if something changed."""
+        if not self.dirty:
+            return
+        data = json.dumps({"version": MANIFEST_VERSION, "entries": self.entries}, separators=(",", ":"))
+        write_atomic(self.path, data.encode("utf-8"))
+        self.dirty = False
+
+
+def plan_build(source_root, output_root, manifest, options, name_suffix):
+    """Compares both trees with the manifest and returns a BuildPlan."""
+    sources = scan_tree(source_root, '.png')
+    outputs = scan_tree(output_root, '.ico') if os.path.isdir(output_root) else {}
+    # Same names as ico_filename_for, minus four path calls per file: every
+    # source ends in '.png', so '<dir>/<base>.png' -> '<dir>/<base>_<suffix>.ico'
+    output_tail = f"_{name_suffix}.ico"
+    todo = []
+    unchanged = 0
+    for rel, entry in sources.items():
+        stat = entry.stat()
+        rel_output = rel[:-4] + output_tail
+        old = manifest.entries.get(rel)
+        digest = None
+        if old and old["options"] == options and old["output"] == rel_output and rel_output in outputs:
+            if old["mtime_ns"] == stat.st_mtime_ns and old["size"] == stat.st_size:
+                unchanged += 1
+                continue
+            if old["size"] == stat.st_size:
+                digest = file_hash(entry.path)
+                if digest == old["hash"]:
+                    # Touched but identical: remember the new mtime, skip the conversion
+                    old["mtime_ns"] = stat.st_mtime_ns
+                    manifest.dirty = True
+                    unchanged += 1
+                    continue
+        todo.append((rel, stat.st_mtime_ns, stat.st_size, rel_output, digest))
+    orphans = [rel for rel in manifest.entries if rel not in sources]
+    return BuildPlan(todo, orphans, unchanged)
+
+
+def _native(root, rel):
+    return os.path.join(root, *rel.split("/"))
+
+
+def _remove_output(output_root, rel_output):
+    """Deletes an ICO this build wrote earlier, then any folders it leaves empty."""
+    path = _native(output_root, rel_output)
+    root = os.path.abspath(output_root)
+    if os.path.commonpath([root, os.path.abspath(path)]) != root:
+        return # Never touch anything outside the output tree
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    folder = os.path.dirname(os.path.abspath(path))
+    while folder != root:
+        try:
+            os.rmdir(folder)
+        except OSError:
+            break # Not empty
+        folder = os.path.dirname(folder)
+
+
+# --- Building ---
+def run_build(source_root, output_root, size_str=ico_core.DEFAULT_ICON_SIZE, all_sizes=False,
+              resize_mode=RESIZE_QUALITY, frame_formats=None, optimize=None, workers=None,
+              cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, dry_run=False, report=print,
+              progress=None):
+    """Brings `output_root` up to date with `source_root`. Returns (ok_count, failures, plan).
+
+    `workers=1` converts in this process, checking `progress(fraction,
+    message)` between files (the GUI uses this to show progress and
+    cancel); otherwise files go through ico_batch's process pool.
+    `optimize` is None or (max_error, time_budget) as for run_batch.
+    """
+    progress = progress or ico_core._no_progress
+    _, name_suffix = ico_core.resolve_sizes(size_str, all_sizes)
+    options = options_key(size_str, all_sizes, resize_mode, frame_formats, optimize)
+    manifest = BuildManifest(os.path.join(output_root, MANIFEST_NAME))
+    start = time.perf_counter()
+    plan = plan_build(source_root, output_root, manifest, options, name_suffix)
+    report(f"{plan.unchanged} up to date, {len(plan.todo)} to convert, "
+           f"{len(plan.orphans)} to remove ({time.perf_counter() - start:.2f}s to scan)")
+    if dry_run:
+        for rel, _mtime, _size, rel_output, _digest in plan.todo:
+            report(f"NEW  {rel} -> {rel_output}")
+        for rel in plan.orphans:
+            report(f"DEL  {manifest.entries[rel]['output']}")
+        return 0, [], plan
+
+    os.makedirs(output_root, exist_ok=True)
+    ok_count = 0
+    failures = []
+    try:
+        for rel in plan.orphans:
+            entry = manifest.entries.pop(rel)
+            manifest.dirty = True
+            _remove_output(output_root, entry["output"])
+            report(f"DEL  {entry['output']}")
+
+        pending = {}
+        for rel, mtime_ns, size, rel_output, digest in plan.todo:
+            png_path = _native(source_root, rel)
+            pending[png_path] = (rel, mtime_ns, size, rel_output, digest)
+            os.makedirs(os.path.dirname(_native(output_root, rel_output)), exist_ok=True)
+
+        def output_dir_for(png_path):
+            return os.path.dirname(_native(output_root, pending[png_path][3]))
+
+        def on_success(png_path, _ico_path):
+            rel, mtime_ns, size, rel_output, digest = pending[png_path]
+            old = manifest.entries.get(rel)
+            if old and old["output"] != rel_output:
+                _remove_output(output_root, old["output"]) # Options changed the file name
+            manifest.record(rel, mtime_ns, size, digest or file_hash(png_path), options, rel_output)
+
+        if workers == 1:
+            cache = ConversionCache(cache_dir, cache_max_bytes) if cache_dir else None
+            optimizer = Optimizer(*optimize) if optimize else None
+            for done, png_path in enumerate(pending):
+                progress(done / len(pending), f"{done}/{len(pending)}")
+                try:
+                    ico_path = ico_core.convert_file(png_path, output_dir_for(png_path), size_str,
+                                                     all_sizes, resize_mode, cache, frame_formats,
+                                                     optimizer=optimizer)
+                except Exception as e:
+                    # Any one file failing, for whatever reason, never stops the build
+                    failures.append((png_path, e))
+                    report(f"FAIL {png_path}: {e}")
+                else:
+                    ok_count += 1
+                    on_success(png_path, ico_path)
+                    report(f"OK   {png_path} -> {ico_path}")
+        elif pending:
+            ok_count, failures, _ = run_batch(
+                list(pending), None, size_str, all_sizes, workers, None, resize_mode,
+                cache_dir, cache_max_bytes, False, frame_formats, None, optimize, report,
+                output_dir_for=output_dir_for, on_success=on_success)
+    finally:
+        # Also runs on cancellation, so finished files are not converted again
+        manifest.save()
+    return ok_count, failures, plan
+
+
+# --- Command line ---
+def build_parser():
+    """Builds the argument parser for the build sub-command."""
+    parser = argparse.ArgumentParser(
+        prog="pngtoico.py build",
+        description="Mirror a folder tree of PNGs as ICOs, converting only what changed.")
+    parser.add_argument("source", help="Folder tree containing PNG files")
+    parser.add_argument("output", help="Folder the tree is mirrored into (holds the manifest)")
+    parser.add_argument("-s", "--size", default=ico_core.DEFAULT_ICON_SIZE, choices=ico_core.ICON_SIZES,
+                        help=f"Single ICO size (default: {ico_core.DEFAULT_ICON_SIZE})")
+    parser.add_argument("-a", "--all-sizes", action="store_true",
+                        help="Generate all common sizes (16x16 to 256x256) in one ICO")
+    parser.add_argument("--resize", default=RESIZE_QUALITY, choices=RESIZE_MODES,
+                        help="Resize pyramid mode (see 'pngtoico.py batch --help')")
+    parser.add_argument("--frame-format", action="append", metavar="SIZE=FMT",
+                        help="Store a frame size as png or bmp, e.g. 48x48=png; repeatable")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Try several encodings per frame and keep the smallest")
+    parser.add_argument("--max-error", type=float, default=DEFAULT_MAX_ERROR,
+                        help="Largest error any pixel of an optimized frame may get, in 0-255 levels "
+                             "(default: %(default)s = lossless)")
+    parser.add_argument("--optimize-time", type=float, default=DEFAULT_TIME_BUDGET,
+                        help="Seconds the optimizer may spend per file (default: %(default)s)")
+    parser.add_argument("--cache", metavar="DIR", nargs="?", const="",
+                        help="Reuse results from a conversion cache (default folder if DIR omitted)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count; 1 converts in-process)")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="Only report what would be converted or removed")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point. Returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    cache_dir = None
+    if args.cache is not None:
+        cache_dir = args.cache or default_cache_dir()
+    try:
+        frame_formats = ico_core.parse_frame_formats(args.frame_format)
+        _, failures, _ = run_build(args.source, args.output, args.size, args.all_sizes, args.resize,
+                                   frame_formats, (args.max_error, args.optimize_time) if args.optimize else None,
+                                   args.workers, cache_dir, dry_run=args.dry_run)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""Icon bundles for sites and apps: python pngtoico.py bundle logo.png -o site/
+
+One decode and one resize pyramid feed every file of the bundle:
+
+    <name>_all_sizes.ico        the all-sizes ICO (16 to 256px)     target "ico"
+    favicon.ico                 16, 32 and 48px                     target "favicon"
+    favicon-16x16.png, favicon-32x32.png                            target "favicon"
+    apple-touch-icon.png        180px, flattened onto a background  target "apple"
+    android-chrome-192x192.png, android-chrome-512x512.png,
+    site.webmanifest            web app manifest listing them       target "manifest"
+    png/<name>_<N>x<N>.png      one PNG per ICO size                target "png"
+
+Every frame is PNG- or BMP-encoded once, even when several files use it
+(the 32px favicon PNG, the 32px PNG of the set and so on). The encodes
+and then the writes run on a thread pool. Each file is written to a
+temporary name and moved into place, so a half-written bundle is never
+visible. Sizes larger than the source are skipped. The PNGs of a
+non-square source are centred on a transparent square (the touch icon on
+its background), so every PNG is exactly the size in its name and in the
+manifest; the ICOs keep the aspect ratio, like every ICO this tool writes.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageColor
+
+import ico_core
+from ico_file import (FORMAT_BMP, FORMAT_PNG, default_format, encode_bmp, encode_png, png_passthrough_ok,
+                      png_size, write_atomic, write_ico)
+from ico_loader import LazyPng
+from ico_metrics import count, log, setup_logging, span
+from ico_resize import RESIZE_MODES, RESIZE_QUALITY, build_frames, fit_size
+
+TARGETS = ["ico", "favicon", "png", "apple", "manifest"]
+FAVICON_ICO = "favicon.ico"
+FAVICON_ICO_EDGES = [48, 32, 16]
+FAVICON_PNGS = [("favicon-32x32.png", 32), ("favicon-16x16.png", 16)]
+APPLE_TOUCH_ICON = ("apple-touch-icon.png", 180)
+MANIFEST_ICONS = [("android-chrome-512x512.png", 512), ("android-chrome-192x192.png", 192)]
+MANIFEST_NAME = "site.webmanifest"
+PNG_SET_DIR = "png"
+DEFAULT_BACKGROUND = "#ffffff" # apple-touch-icon must be opaque; iOS fills transparency with black
+
+
+ICO_EDGES = sorted((ico_core.parse_size(size_str)[0] for size_str in ico_core.ICON_SIZES), reverse=True)
+
+
+def _centre(frame, edge):
+    return (edge - frame.width) // 2, (edge - frame.height) // 2
+
+
+def square(frame, edge):
+    """Centres `frame` on a transparent `edge` x `edge` canvas; square frames are returned as they are."""
+    if frame.size == (edge, edge):
+        return frame
+    canvas = Image.new("RGBA", (edge, edge), (0, 0, 0, 0))
+    canvas.paste(frame, _centre(frame, edge))
+    return canvas
+
+
+def flatten(frame, edge, background):
+    """Centres `frame` on an opaque `edge` x `edge` canvas of `background`."""
+    canvas = Image.new("RGB", (edge, edge), background)
+    canvas.paste(frame, _centre(frame, edge), frame.getchannel("A") if frame.mode == "RGBA" else None)
+    return canvas
+
+
+# --- Bundle ---
+def plan_bundle(targets, name):
+    """Lists what `targets` write: ([(rel_path, edge)] PNGs, [(rel_path, [edges])] ICOs, manifest?)."""
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        raise ValueError(f"Unknown bundle target(s): {', '.join(sorted(unknown))}")
+    pngs, icos = [], []
+    if "ico" in targets:
+        icos.append((f"{name}_{ico_core.ALL_SIZES_SUFFIX}.ico", ICO_EDGES))
+    if "favicon" in targets:
+        icos.append((FAVICON_ICO, FAVICON_ICO_EDGES))
+        pngs.extend(FAVICON_PNGS)
+    if "png" in targets:
+        pngs.extend((f"{PNG_SET_DIR}/{name}_{edge}x{edge}.png", edge) for edge in ICO_EDGES)
+    if "manifest" in targets:
+        pngs.extend(MANIFEST_ICONS)
+    return pngs, icos, "manifest" in targets
+
+
+def build_bundle(png_path, output_dir, targets=TARGETS, resize_mode=RESIZE_QUALITY, frame_formats=None,
+                 background=DEFAULT_BACKGROUND, workers=None):
+    """Writes the bundle for `png_path` into `output_dir`.
+
+    Returns (written, skipped): the paths written and the file names left
+    out because the source is smaller than they need.
+    """
+    name = os.path.splitext(os.path.basename(png_path))[0]
+    pngs, icos, manifest = plan_bundle(targets, name)
+    apple = "apple" in targets
+    background = ImageColor.getrgb(background)[:3]
+    formats = frame_formats or {}
+    edges = {edge for _rel, edge in pngs} | {edge for _rel, ico_edges in icos for edge in ico_edges}
+    if apple:
+        edges.add(APPLE_TOUCH_ICON[1])
+
+    # --- One decode, one pyramid ---
+    source = LazyPng(png_path, max_icon_edge=max(edges))
+    image = source.image
+    if image.width != image.height:
+        log.warning(f"{png_path} is {image.width}x{image.height}, not square; "
+                    f"its PNGs are padded to square with transparency")
+    with span("resize"):
+        frames = build_frames(image, [(edge, edge) for edge in edges], resize_mode, max_edge=max(edges))
+    by_size = {frame.size: frame for frame in frames}
+
+    def frame_for(edge):
+        if edge > image.width or edge > image.height:
+            return None # Never upscaled, like the sizes of an ICO
+        return by_size.get(fit_size(image.size, (edge, edge)))
+
+    # --- Encode every payload once ---
+    passthrough = png_size(source.png_bytes) if png_passthrough_ok(source.png_bytes) else None
+    jobs = {}
+    for _rel, edge in pngs:
+        frame = frame_for(edge)
+        if frame is not None:
+            jobs[(FORMAT_PNG, (edge, edge))] = square(frame, edge)
+    for _rel, ico_edges in icos:
+        for edge in ico_edges:
+            frame = frame_for(edge)
+            if frame is not None:
+                jobs[(formats.get(max(frame.size)) or default_format(frame.size), frame.size)] = frame
+
+    def encode(job):
+        (fmt, size), frame = job
+        if fmt == FORMAT_PNG:
+            return source.png_bytes if size == passthrough else encode_png(frame)
+        if fmt == FORMAT_BMP:
+            return encode_bmp(frame)
+        raise ValueError(f"Unknown ICO frame format: {fmt}")
+
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bundle") as pool:
+        with span("encode"):
+            apple_frame = frame_for(APPLE_TOUCH_ICON[1]) if apple else None
+            # iOS shows transparent pixels as black, so the touch icon gets a background
+            apple_job = (pool.submit(lambda: encode_png(flatten(apple_frame, APPLE_TOUCH_ICON[1], background)))
+                         if apple_frame is not None else None)
+            # Largest first, so the slowest encodes never end up as the tail
+            order = sorted(jobs, key=lambda job: job[1][0] * job[1][1], reverse=True)
+            payloads = dict(zip(order, pool.map(encode, [(job, jobs[job]) for job in order])))
+
+        # --- Fan out to the writers ---
+        outputs, skipped = {}, []
+        for rel, edge in pngs:
+            frame = frame_for(edge)
+            if frame is None:
+                skipped.append(rel)
+            else:
+                outputs[rel] = payloads[(FORMAT_PNG, (edge, edge))]
+        if apple:
+            if apple_job is None:
+                skipped.append(APPLE_TOUCH_ICON[0])
+            else:
+                outputs[APPLE_TOUCH_ICON[0]] = apple_job.result()
+        for rel, ico_edges in icos:
+            encoded = []
+            for edge in ico_edges:
+                frame = frame_for(edge)
+                if frame is not None and frame.size not in (entry[0] for entry in encoded):
+                    fmt = formats.get(max(frame.size)) or default_format(frame.size)
+                    encoded.append((frame.size, 32, payloads[(fmt, frame.size)]))
+            if not encoded:
+                skipped.append(rel)
+                continue
+            outputs[rel] = lambda fp, encoded=encoded: write_ico(fp, encoded)
+        if manifest:
+            icons = [{"src": rel, "sizes": f"{edge}x{edge}", "type": "image/png"}
+                     for rel, edge in MANIFEST_ICONS if rel in outputs]
+            colour = "#{:02x}{:02x}{:02x}".format(*background)
+            if not icons:
+                skipped.append(MANIFEST_NAME)
+            else:
+                outputs[MANIFEST_NAME] = json.dumps(
+                    {"name": name, "short_name": name, "icons": icons, "theme_color": colour,
+                     "background_color": colour, "display": "standalone"}, indent=2).encode("utf-8")
+
+        for folder in {os.path.dirname(rel) for rel in outputs}:
+            os.makedirs(os.path.join(output_dir, folder), exist_ok=True)
+        with span("write"):
+            written = [os.path.join(output_dir, rel) for rel in outputs]
+            list(pool.map(write_atomic, written, outputs.values()))
+    count("bundles_total")
+    return written, skipped
+
+
+# --- Command line ---
+def build_parser():
+    """Builds the argument parser for the bundle sub-command."""
+    parser = argparse.ArgumentParser(
+        prog="pngtoico.py bundle",
+        description="Write an ICO, favicons, apple-touch-icon, web manifest icons and a PNG set "
+                    "from one PNG.")
+    parser.add_argument("png", help="Source PNG (512px or larger gives every file)")
+    parser.add_argument("-o", "--output", default=".", help="Output folder (default: current folder)")
+    parser.add_argument("-t", "--target", action="append", choices=TARGETS,
+                        help="Only write these parts of the bundle; repeatable (default: all)")
+    parser.add_argument("--background", default=DEFAULT_BACKGROUND,
+                        help="apple-touch-icon background and manifest colours (default: %(default)s)")
+    parser.add_argument("--resize", default=RESIZE_QUALITY, choices=RESIZE_MODES,
+                        help="Resize pyramid mode (see 'pngtoico.py batch --help')")
+    parser.add_argument("--frame-format", action="append", metavar="SIZE=FMT",
+                        help="Store an ICO frame size as png or bmp, e.g. 48x48=png; repeatable")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Encoder/writer threads (default: CPU count)")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point. Returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    start = time.perf_counter()
+    try:
+        frame_formats = ico_core.parse_frame_formats(args.frame_format)
+        os.makedirs(args.output, exist_ok=True)
+        written, skipped = build_bundle(args.png, args.output, args.target or TARGETS, args.resize,
+                                        frame_formats, args.background, args.workers)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    for path in written:
+        print(f"OK   {path}")
+    for rel in skipped:
+        log.warning(f"Skipped {rel}: the source is smaller than that")
+    print(f"Wrote {len(written)} files in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Content-addressed on-disk cache of converted ICO files.
+
+Entries are keyed on a hash of the decoded source pixels plus the requested
+sizes and options, so converting the same artwork again (under any file
+name) just copies or hardlinks the cached ICO. Entries are written
+atomically, bumped on every hit, and the least recently used ones are
+evicted once the cache grows past its byte budget. Several processes may
+share one cache folder; eviction is serialised with a lock file.
+
+A hardlinked output shares its inode with the cache entry, so outputs must
+only ever be replaced, never rewritten in place (ico_file.write_atomic).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from ico_file import file_mode, write_atomic
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Bump when the conversion output changes so stale entries are never served
+CACHE_FORMAT_VERSION = 4
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+
+def default_cache_dir():
+    """Per-user cache folder (LOCALAPPDATA on Windows, XDG_CACHE_HOME elsewhere)."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pngtoico')
+
+
+class _FolderLock:
+    """Exclusive inter-process lock held on a file inside the cache folder."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, 'a+b')
+        if fcntl:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        else:
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl:
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+            else:
+                self._fh.seek(0)
+                msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._fh.close()
+            self._fh = None
+
+
+class ConversionCache:
+    """LRU cache of ICO files under `root`, bounded to roughly `max_bytes`."""
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, hardlink=False):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hardlink = hardlink # Hardlink hits into place instead of copying them
+        self.objects_dir = os.path.join(self.root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock_path = os.path.join(self.root, '.lock')
+        self._approx_bytes = None # Lazily measured, then tracked per store
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    # --- Keys ---
+    @staticmethod
+    def key_for(image, ico_sizes, **options):
+        """Hashes the decoded pixels of `image` together with the conversion options."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"v{CACHE_FORMAT_VERSION}|{image.mode}|{image.size}|".encode())
+        digest.update(repr(sorted(set(map(tuple, ico_sizes)))).encode())
+        digest.update(repr(sorted(options.items())).encode())
+        if image.mode == 'P':
+            digest.update(bytes(image.getpalette() or []))
+        if 'transparency' in image.info:
+            digest.update(repr(image.info['transparency']).encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], f"{key}.ico")
+
+    # --- Lookup / store ---
+    def fetch(self, key, dest_path):
+        """Places the cached ICO for `key` at `dest_path`. Returns True on a hit."""
+        entry = self._entry_path(key)
+        try:
+            self._place(entry, dest_path)
+            os.utime(entry) # Mark as recently used for LRU eviction
+        except FileNotFoundError:
+            # Never stored, or evicted by another process a moment ago
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, src_path):
+        """Adds the freshly written ICO at `src_path` to the cache under `key`."""
+        entry = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # Atomic publish: readers see either no entry or a complete one. The
+        # new mode matters too: hardlinked hits share the entry's permissions.
+        with open(src_path, 'rb') as src:
+            write_atomic(entry, lambda fp: shutil.copyfileobj(src, fp), file_mode())
+        self.stores += 1
+        if self._approx_bytes is None:
+            self._approx_bytes = self._measure()[1]
+        else:
+            self._approx_bytes += os.path.getsize(entry)
+        if self._approx_bytes > self.max_bytes:
+            self.evict()
+
+    def _place(self, entry, dest_path):
+        """Copies or hardlinks `entry` to `dest_path`, replacing it atomically."""
+        if self.hardlink and self._link(entry, dest_path):
+            return
+        # A copied hit gets the same permissions as a freshly converted file
+        with open(entry, 'rb') as src:
+            write_atomic(dest_path, lambda fp: shutil.copyfileobj(src, fp), file_mode())
+
+    def _link(self, entry, dest_path):
+        """Hardlinks `entry` to `dest_path`. Returns False if links are not supported there."""
+        dest_dir = os.path.dirname(os.path.abspath(dest_path))
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix='.tmp')
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            os.link(entry, tmp_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            return False # Different volume or no hardlink support; copy instead
+        try:
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return True
+
+    # --- Eviction / stats ---
+    def _entries(self):
+        """Yields (mtime, size, path) for every cache entry."""
+        for bucket in os.scandir(self.objects_dir):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith('.ico'):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield st.st_mtime, st.st_size, entry.path
+
+    def _measure(self):
+        entries = list(self._entries())
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits its budget."""
+        with _FolderLock(self._lock_path):
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass # Another process got there first
+                except OSError:
+                    continue # In use (Windows); try the next one
+                total -= size
+                self.evictions += 1
+            self._approx_bytes = total
+
+    def stats(self):
+        """Returns hit/miss counters for this instance plus current disk usage."""
+        entries, total = self._measure()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+        }
@@ -0,0 +1,229 @@
+"""GUI-free conversion helpers shared by the Tk app and the headless tools.
+
+Nothing in here may import tkinter or ttkthemes: the batch CLI and its
+worker processes import this module directly.
+"""
+import io
+import os
+
+from ico_file import FRAME_FORMATS, encode_frames, write_atomic, write_ico
+from ico_loader import LazyPng
+from ico_metrics import METRICS, count, log, span
+from ico_resize import RESIZE_QUALITY, build_frames
+
+# --- Configuration ---
+DEFAULT_ICON_SIZE = "32x32"
+ICON_SIZES = ["16x16", "24x24", "32x32", "48x48", "64x64", "128x128", "256x256"]
+ALL_SIZES_SUFFIX = "all_sizes"
+
+
+def parse_frame_formats(specs):
+    """Parses ['48x48=png', '16=bmp', ...] into {edge_length: format} for ico_file."""
+    formats = {}
+    for spec in specs or []:
+        size_part, sep, fmt = spec.partition('=')
+        fmt = fmt.strip().lower()
+        if not sep or fmt not in FRAME_FORMATS:
+            raise ValueError(f"Invalid frame format '{spec}', expected SIZE=png or SIZE=bmp")
+        if 'x' not in size_part:
+            size_part = f"{size_part}x{size_part}"
+        formats[max(parse_size(size_part.strip()))] = fmt
+    return formats
+
+
+def parse_size(size_str):
+    """Parses a 'WxH' string into a (width, height) tuple, validating the range."""
+    if 'x' not in size_str:
+        raise ValueError("Invalid size format selected.")
+    try:
+        width, height = map(int, size_str.split('x'))
+        if not (0 < width <= 512 and 0 < height <= 512): # Basic sanity check
+            raise ValueError("Invalid dimensions")
+    except ValueError:
+        raise ValueError(f"Invalid size specified: {size_str}")
+    return width, height
+
+
+def resolve_sizes(size_str, all_sizes=False):
+    """Returns (ico_sizes, name_suffix) for either a single size or all common sizes."""
+    if all_sizes:
+        return [parse_size(s) for s in ICON_SIZES], ALL_SIZES_SUFFIX
+    width, height = parse_size(size_str)
+    return [(width, height)], f"{width}x{height}"
+
+
+def ico_filename_for(source_path, name_suffix):
+    """Builds the output name used everywhere: '<base>_<WxH>.ico' or '<base>_all_sizes.ico'."""
+    base_name = os.path.splitext(os.path.basename(source_path))[0]
+    return f"{base_name}_{name_suffix}.ico"
+
+
+def _no_progress(fraction, message=""):
+    pass
+
+
+def save_ico(image, ico_path, ico_sizes, resize_mode=RESIZE_QUALITY, cache=None,
+             source_png=None, frame_formats=None, progress=None, optimizer=None):
+    """Writes `image` to `ico_path` as an ICO containing `ico_sizes`.
+
+    With a ConversionCache, identical pixels + options are served from the
+    cache instead of being resized and encoded again. `source_png` (the
+    original file bytes) and `frame_formats` are passed to ico_file. An
+    ico_optimize.Optimizer replaces the default frame encoding with the
+    smallest acceptable one.
+    `progress(fraction, message)` is called between stages; it may raise
+    to abort the conversion before anything is written.
+    """
+    progress = progress or _no_progress
+    with METRICS.maybe_profile():
+        key = None
+        if cache is not None:
+            progress(0.1, "Checking cache...")
+            key, hit = _lookup(cache, image, ico_path, ico_sizes, resize_mode, frame_formats, optimizer)
+            if hit:
+                progress(1.0, "Copied from cache")
+                return
+        _write_ico(image, ico_path, ico_sizes, resize_mode, source_png, frame_formats, progress,
+                   optimizer)
+        _finish(ico_path, cache, key)
+
+
+def _lookup(cache, image, ico_path, ico_sizes, resize_mode, frame_formats, optimizer,
+            resample="pillow"):
+    """Copies a cached ICO to `ico_path` if there is one. Returns (key, hit).
+
+    `resample` names the resize backend, since each writes slightly different bytes.
+    """
+    options = {}
+    if resample != "pillow":
+        options["resample"] = resample
+    if optimizer is not None:
+        options["optimize_max_error"] = optimizer.max_error
+    with span("cache_lookup"):
+        key = cache.key_for(image, ico_sizes, resize_mode=resize_mode,
+                            frame_formats=sorted((frame_formats or {}).items()), **options)
+        hit = cache.fetch(key, ico_path)
+    if hit:
+        count("cache_hits_total")
+        count("conversions_total")
+    return key, hit
+
+
+def _finish(ico_path, cache, key):
+    """Counts a freshly written ICO and stores it in the cache."""
+    count("conversions_total")
+    if METRICS.enabled:
+        count("bytes_out_total", os.path.getsize(ico_path))
+    if cache is not None:
+        try:
+            cache.store(key, ico_path)
+        except OSError as e:
+            # A full or read-only cache must never fail the conversion itself
+            log.warning(f"Could not update conversion cache: {e}")
+
+
+def _write_ico(image, ico_path, ico_sizes, resize_mode, source_png, frame_formats, progress,
+               optimizer=None, frames=None):
+    """Resizes and encodes `image` into a fresh ICO file (a path or a binary file object).
+
+    `frames` skips the resize when they were already built (see convert_files).
+    """
+    # Resize once through the shared pyramid, then encode the frames in parallel
+    if frames is None:
+        progress(0.2, "Resizing...")
+        with span("resize"):
+            frames = build_frames(image, ico_sizes, resize_mode)
+    if not frames:
+        # Every size is larger than the source; keep Pillow's own behaviour
+        progress(0.6, "Encoding...")
+        with span("encode"):
+            if hasattr(ico_path, "write"):
+                image.save(ico_path, format='ICO', sizes=ico_sizes)
+            else:
+                write_atomic(ico_path, lambda fp: image.save(fp, format='ICO', sizes=ico_sizes))
+        return
+    progress(0.6, "Optimizing..." if optimizer else "Encoding...")
+    with span("encode"):
+        encode = optimizer.encode if optimizer is not None else encode_frames
+        encoded = encode(frames, frame_formats, source_png)
+    progress(0.9, "Writing...")
+    with span("write"):
+        if hasattr(ico_path, "write"):
+            write_ico(ico_path, encoded)
+        else:
+            # Replaced, never rewritten: the old file may be a hardlinked cache entry
+            write_atomic(ico_path, lambda fp: write_ico(fp, encoded))
+
+
+def convert_file(png_path, output_dir, size_str=DEFAULT_ICON_SIZE, all_sizes=False,
+                 resize_mode=RESIZE_QUALITY, cache=None, frame_formats=None, progress=None,
+                 optimizer=None):
+    """Converts one PNG on disk to an ICO in `output_dir`. Returns the ICO path."""
+    ico_sizes, name_suffix = resolve_sizes(size_str, all_sizes)
+    # Profile the decode too when this is the conversion picked for profiling
+    with METRICS.maybe_profile():
+        # Only a reduced working copy of the source is kept once it is decoded
+        source = LazyPng(png_path, max_icon_edge=max(max(size) for size in ico_sizes))
+        ico_path = os.path.join(output_dir, ico_filename_for(png_path, name_suffix))
+        save_ico(source.image, ico_path, ico_sizes, resize_mode, cache, source.png_bytes,
+                 frame_formats, progress, optimizer)
+    return ico_path
+
+
+def convert_files(png_paths, output_dir, size_str=DEFAULT_ICON_SIZE, all_sizes=False,
+                  resize_mode=RESIZE_QUALITY, cache=None, frame_formats=None, optimizer=None):
+    """Converts several PNGs into `output_dir`, resizing same-size sources together.
+
+    The resize runs through ico_resample.build_frames_batch (NumPy, when
+    installed); files found in `cache` are not resized at all. Returns one
+    entry per path, in order: (ico_path, cache_hit), or the exception that
+    file failed with.
+    """
+    from ico_resample import backend, build_frames_batch # NumPy is only loaded by batched conversions
+    resample = backend()
+    ico_sizes, name_suffix = resolve_sizes(size_str, all_sizes)
+    max_icon_edge = max(max(size) for size in ico_sizes)
+    results = [None] * len(png_paths)
+    todo = [] # (index, source, ico_path, cache key)
+    for index, png_path in enumerate(png_paths):
+        try:
+            source = LazyPng(png_path, max_icon_edge=max_icon_edge)
+            # Decoded here, so a damaged file fails on its own instead of the whole group
+            image = source.image
+            ico_path = os.path.join(output_dir, ico_filename_for(png_path, name_suffix))
+            key = None
+            if cache is not None:
+                key, hit = _lookup(cache, image, ico_path, ico_sizes, resize_mode,
+                                   frame_formats, optimizer, resample)
+                if hit:
+                    results[index] = (ico_path, True)
+                    continue
+            todo.append((index, source, ico_path, key))
+        except Exception as e:
+            results[index] = e
+
+    with span("resize"):
+        batch = build_frames_batch([source.image for _index, source, _path, _key in todo],
+                                   ico_sizes, resize_mode)
+    for (index, source, ico_path, key), frames in zip(todo, batch):
+        try:
+            _write_ico(source.image, ico_path, ico_sizes, resize_mode, source.png_bytes,
+                       frame_formats, _no_progress, optimizer, frames)
+            _finish(ico_path, cache, key)
+            results[index] = (ico_path, False)
+        except Exception as e:
+            results[index] = e
+    return results
+
+
+def convert_bytes(png_bytes, size_str=DEFAULT_ICON_SIZE, all_sizes=False, resize_mode=RESIZE_QUALITY,
+                  frame_formats=None, optimizer=None, name="<memory>"):
+    """Converts PNG file contents to ICO file contents without touching the disk."""
+    ico_sizes, _ = resolve_sizes(size_str, all_sizes)
+    source = LazyPng(name, max_icon_edge=max(max(size) for size in ico_sizes), png_bytes=png_bytes)
+    buffer = io.BytesIO()
+    _write_ico(source.image, buffer, ico_sizes, resize_mode, source.png_bytes, frame_formats,
+               _no_progress, optimizer)
+    count("conversions_total")
+    count("bytes_out_total", buffer.tell())
+    return buffer.getvalue()
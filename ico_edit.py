@@ -0,0 +1,234 @@
+"""Reading and patching existing ICO files: python pngtoico.py edit ...
+
+read_index() lists an icon's frames from the ICONDIR/ICONDIRENTRY table
+plus the first few bytes of each frame, without decoding any pixels.
+update_ico() adds, replaces or removes individual frames and rewrites the
+file atomically; every untouched frame is copied byte-for-byte, so
+adding a 48x48 frame to an all-sizes icon only resizes and encodes that
+one frame.
+"""
+import argparse
+import os
+import struct
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import ico_core
+from ico_batch import collect_inputs
+from ico_file import (ICONDIR, ICONDIRENTRY, PNG_SIGNATURE, FORMAT_BMP, FORMAT_PNG,
+                      decode_frame, encode_frames, file_mode, png_size, write_atomic, write_ico)
+from ico_loader import LazyPng
+from ico_metrics import setup_logging
+from ico_resize import RESIZE_MODES, RESIZE_QUALITY, build_frames
+
+# One directory entry. `size` is the real frame size (read from the PNG or
+# DIB header, so 256px and larger frames are exact), `offset`/`length`
+# locate the frame's bytes in the file.
+IconFrame = namedtuple("IconFrame", "size bpp fmt offset length")
+
+_FRAME_HEADER_BYTES = 24 # Enough for a PNG's IHDR size or a DIB's width/height/bpp
+
+
+# --- Reading ---
+def read_index(ico_path):
+    """Lists the frames of `ico_path` (in file order) without decoding them."""
+    with open(ico_path, 'rb') as fp:
+        return _read_index(fp)
+
+
+def _read_index(fp):
+    file_size = fp.seek(0, os.SEEK_END)
+    fp.seek(0)
+    header = fp.read(ICONDIR.size)
+    if len(header) < ICONDIR.size:
+        raise ValueError("Not an ICO file.")
+    reserved, kind, count = ICONDIR.unpack(header)
+    if reserved != 0 or kind != 1: # 2 would be a cursor
+        raise ValueError("Not an ICO file.")
+    table = fp.read(ICONDIRENTRY.size * count)
+    if len(table) < ICONDIRENTRY.size * count:
+        raise ValueError("Truncated ICO directory.")
+
+    frames = []
+    for index in range(count):
+        width, height, _colors, _reserved, _planes, bpp, length, offset = \
+            ICONDIRENTRY.unpack_from(table, index * ICONDIRENTRY.size)
+        if offset + length > file_size:
+            raise ValueError(f"ICO frame {index} lies outside the file.")
+        fp.seek(offset)
+        head = fp.read(min(length, _FRAME_HEADER_BYTES))
+        if head.startswith(PNG_SIGNATURE) and len(head) >= 24:
+            fmt, size = FORMAT_PNG, png_size(head)
+        else:
+            # 0 means 256 in the directory; the DIB header has the real values
+            fmt, size = FORMAT_BMP, (width or 256, height or 256)
+            if len(head) >= 16:
+                dib_width, dib_height, _planes, dib_bpp = struct.unpack_from("<iiHH", head, 4)
+                size = (dib_width, abs(dib_height) // 2) # height covers XOR + AND masks
+                bpp = bpp or dib_bpp
+        frames.append(IconFrame(size, bpp, fmt, offset, length))
+    return frames
+
+
+def load_frame(ico_path, frame):
+    """Decodes a single frame (an IconFrame from read_index) into an RGBA image."""
+    with open(ico_path, 'rb') as fp:
+        fp.seek(frame.offset)
+        data = fp.read(frame.length)
+    return decode_frame(frame.size, frame.bpp, data)
+
+
+# --- Updating ---
+def update_ico(ico_path, new_frames=(), remove_sizes=(), formats=None, source_png=None,
+               out_path=None):
+    """Adds or replaces `new_frames` and drops `remove_sizes` in an existing ICO.
+
+    A new frame replaces any existing frame of the same size. Frames to
+    remove are matched on their larger side (48x48 also removes a 48x24
+    frame of a wide icon), like the keys of `formats`. All other frames
+    are copied unchanged. `formats` and `source_png` are passed to
+    ico_file.encode_frames. The result is written atomically to
+    `out_path` (default: over `ico_path`). Returns (added, replaced,
+    removed) lists of sizes.
+    """
+    new_sizes = {frame.size for frame in new_frames}
+    remove_edges = {max(size) for size in remove_sizes}
+    kept, replaced, removed = [], [], []
+    with open(ico_path, 'rb') as fp:
+        for entry in _read_index(fp):
+            if entry.size in new_sizes:
+                replaced.append(entry.size)
+            elif max(entry.size) in remove_edges:
+                removed.append(entry.size)
+            else:
+                fp.seek(entry.offset)
+                kept.append((entry.size, entry.bpp, fp.read(entry.length)))
+    encoded = encode_frames(list(new_frames), formats, source_png) if new_frames else []
+    if not kept and not encoded:
+        raise ValueError("Refusing to remove every frame of the icon.")
+    added = [size for size in new_sizes if size not in replaced]
+    # Largest first, like every icon this tool writes
+    frames = sorted(kept + encoded, key=lambda e: e[0], reverse=True)
+    # An edited copy keeps the permissions of the icon it was made from
+    write_atomic(out_path or ico_path, lambda fp: write_ico(fp, frames), file_mode(ico_path))
+    return sorted(added, reverse=True), replaced, removed
+
+
+def add_sizes(ico_path, ico_sizes, source_path=None, resize_mode=RESIZE_QUALITY, formats=None,
+              out_path=None):
+    """Adds (or regenerates) the `ico_sizes` frames of an existing ICO.
+
+    The new frames are resized from `source_path` when given, otherwise
+    from the icon's own largest frame, which is the only frame decoded.
+    Returns (added, replaced, removed) like update_ico().
+    """
+    source_png = None
+    if source_path:
+        loader = LazyPng(source_path, max_icon_edge=max(max(size) for size in ico_sizes))
+        image, source_png = loader.image, loader.png_bytes
+    else:
+        largest = max(read_index(ico_path), key=lambda entry: entry.size[0] * entry.size[1])
+        image = load_frame(ico_path, largest)
+    frames = build_frames(image, ico_sizes, resize_mode)
+    if not frames:
+        raise ValueError(f"Every requested size is larger than the {image.width}x{image.height} source.")
+    return update_ico(ico_path, frames, (), formats, source_png, out_path)
+
+
+# --- Command line ---
+def parse_sizes(specs):
+    """Parses ['48x48', '16', ...] into a list of (width, height) tuples."""
+    return [ico_core.parse_size(spec if 'x' in spec else f"{spec}x{spec}") for spec in specs]
+
+
+def _describe(ico_path):
+    lines = [f"{ico_path}:"]
+    for frame in read_index(ico_path):
+        width, height = frame.size
+        lines.append(f"  {width:>3}x{height:<3} {frame.bpp:>2} bpp  {frame.fmt}  {frame.length:>8} bytes")
+    return "\n".join(lines)
+
+
+def _sizes_text(sizes):
+    return ", ".join(f"{w}x{h}" for w, h in sizes) or "-"
+
+
+def build_parser():
+    """Builds the argument parser for the edit sub-command."""
+    parser = argparse.ArgumentParser(
+        prog="pngtoico.py edit",
+        description="List, add, replace or remove frames of existing ICO files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(cmd):
+        cmd.add_argument("icons", nargs="+", help="ICO files or folders containing ICO files")
+        cmd.add_argument("-r", "--recursive", action="store_true", help="Descend into sub-folders")
+        cmd.add_argument("-j", "--workers", type=int, default=None,
+                         help="Files processed at once (default: CPU count)")
+
+    add_common(commands.add_parser("list", help="Show each icon's frames without decoding them"))
+
+    add_cmd = commands.add_parser("add", help="Add frames, replacing any of the same size")
+    add_common(add_cmd)
+    add_cmd.add_argument("-s", "--size", action="append", required=True, metavar="WxH",
+                         help="Frame size to add, e.g. 48x48 or 48; repeatable")
+    add_cmd.add_argument("--source", help="PNG to resize from (default: the icon's largest frame)")
+    add_cmd.add_argument("--resize", default=RESIZE_QUALITY, choices=RESIZE_MODES,
+                         help="Resize pyramid mode (see 'pngtoico.py batch --help')")
+    add_cmd.add_argument("--frame-format", action="append", metavar="SIZE=FMT",
+                         help="Store a frame size as png or bmp, e.g. 48x48=png; repeatable")
+
+    remove_cmd = commands.add_parser("remove", help="Remove frames of the given sizes")
+    add_common(remove_cmd)
+    remove_cmd.add_argument("-s", "--size", action="append", required=True, metavar="WxH",
+                            help="Frame size to remove, e.g. 16x16 or 16; repeatable")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point. Returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    paths = list(collect_inputs(args.icons, recursive=args.recursive, extension='.ico'))
+    try:
+        if args.command == "list":
+            def task(ico_path):
+                return _describe(ico_path)
+        elif args.command == "add":
+            sizes = parse_sizes(args.size)
+            formats = ico_core.parse_frame_formats(args.frame_format)
+            if args.source and len(paths) > 1:
+                raise ValueError("--source can only be used with a single icon.")
+
+            def task(ico_path):
+                added, replaced, _ = add_sizes(ico_path, sizes, args.source, args.resize, formats)
+                return f"OK   {ico_path}: added {_sizes_text(added)}, replaced {_sizes_text(replaced)}"
+        else:
+            sizes = parse_sizes(args.size)
+
+            def task(ico_path):
+                _, _, removed = update_ico(ico_path, remove_sizes=sizes)
+                return f"OK   {ico_path}: removed {_sizes_text(removed)}"
+    except ValueError as ve:
+        print(f"Error: {ve}", file=sys.stderr)
+        return 2
+
+    def run(ico_path):
+        try:
+            return True, task(ico_path)
+        except Exception as e:
+            # A damaged file fails on its own; the others are still edited
+            return False, f"FAIL {ico_path}: {e}"
+
+    failed = 0
+    # Pillow releases the GIL while resizing and encoding, so threads suffice
+    with ThreadPoolExecutor(max_workers=args.workers or os.cpu_count() or 1) as pool:
+        for ok, message in pool.map(run, paths):
+            failed += not ok
+            print(message)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
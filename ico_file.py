@@ -0,0 +1,176 @@
+"""Native ICO writer.
+
+Pillow's ICO plugin encodes every frame one after another in a single
+save() call. Here each frame is encoded on a thread pool (Pillow's PNG and
+raw encoders release the GIL), as PNG or as a 32-bit BMP/DIB depending on
+its size, and the ICONDIR, entries and image data are then written to the
+output file in a single sequential pass. A source PNG that is already
+exactly one of the frame sizes is embedded byte-for-byte.
+
+write_atomic() is how every output of this tool reaches the disk.
+"""
+import io
+import os
+import stat
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+FORMAT_PNG = "png"
+FORMAT_BMP = "bmp"
+FRAME_FORMATS = [FORMAT_PNG, FORMAT_BMP]
+# Frames at least this large are stored PNG-compressed, smaller ones as BMP,
+# which is what Windows itself ships and what older readers expect.
+PNG_MIN_SIZE = 256
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+ICONDIR = struct.Struct("<HHH")           # reserved, type (1 = icon), count
+ICONDIRENTRY = struct.Struct("<BBBBHHII")  # w, h, colors, reserved, planes, bpp, size, offset
+BITMAPINFOHEADER = struct.Struct("<IiiHHIIiiII")
+
+# Read once at import: querying the umask means setting it, which would race
+# with threads creating files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def default_format(size):
+    """Frame format used when the caller does not pick one for `size`."""
+    return FORMAT_PNG if max(size) >= PNG_MIN_SIZE else FORMAT_BMP
+
+
+def encode_png(frame):
+    """Encodes a frame as a PNG stream."""
+    buffer = io.BytesIO()
+    frame.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def encode_bmp(frame):
+    """Encodes a frame as a 32-bit BGRA DIB followed by its 1-bit AND mask."""
+    frame = frame if frame.mode == "RGBA" else frame.convert("RGBA")
+    width, height = frame.size
+    # DIB rows are stored bottom-up; the raw encoder flips with orientation -1
+    xor_bits = frame.tobytes("raw", "BGRA", 0, -1)
+    # AND mask: 1 where fully transparent, rows padded to 32 bits, bottom-up
+    mask_stride = ((width + 31) // 32) * 4
+    mask = frame.getchannel("A").point(lambda a: 255 if a == 0 else 0).convert("1")
+    and_bits = mask.tobytes("raw", "1", mask_stride, -1)
+    header = BITMAPINFOHEADER.pack(
+        BITMAPINFOHEADER.size, width, height * 2, # height covers XOR + AND masks
+        1, 32, 0, len(xor_bits) + len(and_bits), 0, 0, 0, 0)
+    return header + xor_bits + and_bits
+
+
+def png_passthrough_ok(png_bytes):
+    """True if `png_bytes` can be embedded as-is: 8-bit RGBA, non-interlaced."""
+    # Vista+ only promises to read 32bpp RGBA PNG frames, so anything else
+    # (palette, 16-bit, greyscale, Adam7) is re-encoded instead.
+    if not png_bytes or not png_bytes.startswith(PNG_SIGNATURE) or len(png_bytes) < 33:
+        return False
+    if png_bytes[12:16] != b"IHDR":
+        return False
+    bit_depth, color_type, _comp, _filter, interlace = png_bytes[24:29]
+    return bit_depth == 8 and color_type == 6 and interlace == 0
+
+
+def png_size(png_bytes):
+    """Reads (width, height) from a PNG's IHDR chunk."""
+    return struct.unpack(">II", png_bytes[16:24])
+
+
+def encode_frames(frames, formats=None, source_png=None, max_workers=None):
+    """Encodes `frames` in parallel. Returns a list of (size, bits_per_pixel, data).
+
+    `formats` maps a frame's edge length (its larger side, e.g. 48) to
+    FORMAT_PNG/FORMAT_BMP and overrides default_format(). `source_png` is
+    the original file's bytes; it replaces the encoded frame of the same
+    size when it can be embedded unchanged.
+    """
+    formats = formats or {}
+    passthrough_size = None
+    if source_png is not None and png_passthrough_ok(source_png):
+        passthrough_size = png_size(source_png)
+
+    def encode(frame):
+        fmt = formats.get(max(frame.size)) or default_format(frame.size)
+        if fmt == FORMAT_PNG:
+            if frame.size == passthrough_size:
+                return frame.size, 32, source_png
+            return frame.size, 32, encode_png(frame)
+        if fmt == FORMAT_BMP:
+            return frame.size, 32, encode_bmp(frame)
+        raise ValueError(f"Unknown ICO frame format: {fmt}")
+
+    if len(frames) == 1:
+        return [encode(frames[0])]
+    with ThreadPoolExecutor(max_workers=max_workers or len(frames)) as pool:
+        return list(pool.map(encode, frames))
+
+
+def write_ico(fp, encoded):
+    """Writes the ICONDIR, entries and image data for `encoded` frames in one pass."""
+    fp.write(ICONDIR.pack(0, 1, len(encoded)))
+    offset = ICONDIR.size + ICONDIRENTRY.size * len(encoded)
+    for (width, height), bpp, data in encoded:
+        # 0 means 256 in the single-byte width/height fields
+        fp.write(ICONDIRENTRY.pack(width if width < 256 else 0, height if height < 256 else 0,
+                                    0, 0, 1, bpp, len(data), offset))
+        offset += len(data)
+    for _size, _bpp, data in encoded:
+        fp.write(data)
+
+
+def decode_frame(size, bpp, data):
+    """Decodes one encoded frame (PNG or any DIB variant) back into an RGBA image."""
+    # Wrap the frame in a one-entry icon so Pillow's ICO plugin handles
+    # every PNG and legacy DIB variant (palette, 24-bit, AND masks) for us
+    buffer = io.BytesIO()
+    write_ico(buffer, [(size, bpp, data)])
+    buffer.seek(0)
+    image = Image.open(buffer)
+    image.load()
+    return image.convert("RGBA")
+
+
+def save_frames(ico_path, frames, formats=None, source_png=None):
+    """Encodes `frames` (largest first, as built by ico_resize) and writes `ico_path`."""
+    encoded = encode_frames(frames, formats, source_png)
+    write_atomic(ico_path, lambda fp: write_ico(fp, encoded))
+
+
+# --- Writing files ---
+def file_mode(path=None):
+    """Permissions for a file written at `path`: the existing file's, else 0666 minus the umask."""
+    if path is not None:
+        try:
+            return stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            pass
+    return 0o666 & ~_UMASK
+
+
+def write_atomic(path, data, mode=None):
+    """Writes `data` to a temporary file next to `path`, then moves it over `path`.
+
+    `data` is bytes or a callable that writes to the open binary file.
+    Readers never see a half-written file, and a `path` that is a hardlink
+    (see ico_cache) is replaced instead of written through. The file gets
+    `mode`, by default file_mode(path), rather than mkstemp's 0600.
+    """
+    if mode is None:
+        mode = file_mode(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            if callable(data):
+                data(fp)
+            else:
+                fp.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,594 @@
+"""Tk desktop app for pngtoico. Started by `python pngtoico.py`.
+
+Only tkinter itself is imported at load time. ttkthemes is loaded once the
+window is on screen, Pillow's ImageTk with the first preview, and the
+folder watcher, folder-tree builder and web browser when first used.
+"""
+import tkinter as tk
+from tkinter import filedialog, ttk, messagebox
+import os
+import sys
+import threading
+import time
+
+from ico_core import DEFAULT_ICON_SIZE, ICON_SIZES, ico_filename_for, resolve_sizes, save_ico
+from ico_loader import LazyPng
+from ico_metrics import METRICS, configure_from_env, log, setup_logging, span
+from ico_cache import ConversionCache
+from ico_jobs import DONE, FAILED, JobQueue
+
+# --- Configuration ---
+DOWNLOADS_FOLDER = os.path.join(os.path.expanduser('~'), 'Downloads')
+MONITOR_RETRY_SECONDS = 2 # Back-off before restarting the watcher after an error
+JOB_REFRESH_MS = 100      # Job progress is redrawn at most this often
+MAX_FINISHED_JOBS = 20    # Finished jobs kept in the list before the oldest are dropped
+THEME = "awbreezedark"    # ttkthemes theme, applied once the window is shown
+
+# --- Application Class ---
+class PngToIcoConverter(tk.Tk):
+
+    def __init__(self):
+        super().__init__()
+        self.title("PNG to ICO Converter")
+        self.resizable(False, False)
+        try:
+            # When packaged by PyInstaller with --onefile, data files are
+            # extracted to a temporary folder available as sys._MEIPASS.
+            # Use that path when present so the runtime can load bundled
+            # resources like 'icon.ico'. If not found, fall back to
+            # the working directory.
+            base_path = getattr(sys, '_MEIPASS', os.path.abspath('.'))
+            icon_path = os.path.join(base_path, 'icon.ico')
+            if os.path.exists(icon_path):
+                self.iconbitmap(icon_path)
+            else:
+                # If the developer also passed --icon to PyInstaller,
+                # the executable will still have an icon in Explorer.
+                log.info('icon.ico not found at runtime, skipping iconbitmap.')
+        except tk.TclError as e:
+            log.warning(f"Failed to set window icon: {e}")
+            self.update_status("Warning: Application icon not loaded.")
+
+        self.current_file_path = None       # Path of the originally loaded file (for naming output)
+        self.loaded_pil_image = None        # <<< Store the actual PIL Image object here
+        self.loaded_png_bytes = None        # Original file bytes, for ICO pass-through
+        self.current_image_preview = None   # Reference to PhotoImage for display
+
+        # Conversions run on a worker pool; progress comes back via after()
+        self.job_queue = JobQueue(self._on_job_update)
+        self._job_meta = {}                 # job id -> details needed when it finishes
+        self._dirty_jobs = set()            # job ids changed since the last redraw
+        self._job_lock = threading.Lock()
+        self._job_refresh_scheduled = False
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+        # Re-converting the same artwork is served from an on-disk cache
+        try:
+            self.conversion_cache = ConversionCache()
+        except OSError as e:
+            log.warning(f"Conversion cache disabled: {e}")
+            self.conversion_cache = None
+
+        # --- Style ---
+        self.style = ttk.Style()
+        self._configure_styles()
+        # Loading ttkthemes and its Tcl packages is the slowest part of
+        # startup, so the theme is applied once the window is on screen
+        self.after_idle(self._apply_theme)
+
+        # --- UI Elements ---
+        self.configure(padx=15, pady=15)
+
+        # Title
+        title_label = ttk.Label(self, text="PNG to ICO Converter", style='Bold.TLabel')
+        title_label.grid(row=0, column=0, columnspan=2, pady=(0, 20), sticky="ew")
+
+        # Preview Frame & Label
+        preview_frame = ttk.Frame(self, borderwidth=1, relief=tk.SUNKEN, width=210, height=210)
+        preview_frame.grid(row=1, column=0, columnspan=2, pady=(0, 15))
+        preview_frame.grid_propagate(False)
+
+        self.preview_label = ttk.Label(preview_frame, text="No Image Selected", anchor=tk.CENTER, compound=tk.CENTER)
+        self.preview_label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+
+        # Select Button
+        self.select_button = ttk.Button(self, text="Select PNG Image", command=self.select_image)
+        self.select_button.grid(row=2, column=0, columnspan=2, pady=5, sticky="ew")
+
+        # Size Selection
+        size_label = ttk.Label(self, text="ICO Size:")
+        size_label.grid(row=3, column=0, pady=5, sticky="w")
+
+        self.size_var = tk.StringVar(value=DEFAULT_ICON_SIZE)
+        # Make combobox slightly wider if needed
+        self.size_dropdown = ttk.Combobox(self, textvariable=self.size_var, values=ICON_SIZES, state="readonly", width=15)
+        self.size_dropdown.grid(row=3, column=1, pady=5, sticky="ew")
+
+        # Multi-size ICO Option
+        self.generate_all_sizes_var = tk.BooleanVar(value=False)
+        self.generate_all_sizes_check = ttk.Checkbutton(
+            self,
+            text="Generate all common sizes (16x16 to 256x256)",
+            variable=self.generate_all_sizes_var,
+            command=self._toggle_size_dropdown_state, # New method to enable/disable dropdown
+            style='TCheckbutton'
+        )
+        self.generate_all_sizes_check.grid(row=4, column=0, columnspan=2, pady=(5, 10), sticky="w")
+
+        # Convert Button
+        self.convert_button = ttk.Button(self, text="Convert to ICO", command=self.convert_png_to_ico, state=tk.DISABLED)
+        self.convert_button.grid(row=5, column=0, columnspan=2, pady=5, sticky="ew")
+
+        # Conversion Jobs
+        jobs_frame = ttk.LabelFrame(self, text="Conversion Jobs", padding=(10, 5))
+        jobs_frame.grid(row=6, column=0, columnspan=2, pady=(10, 5), sticky="ew")
+
+        self.jobs_tree = ttk.Treeview(jobs_frame, columns=("status", "progress"), height=4, selectmode="extended")
+        self.jobs_tree.heading("#0", text="File")
+        self.jobs_tree.heading("status", text="Status")
+        self.jobs_tree.heading("progress", text="%")
+        self.jobs_tree.column("#0", width=150)
+        self.jobs_tree.column("status", width=70, anchor=tk.W)
+        self.jobs_tree.column("progress", width=40, anchor=tk.E)
+        self.jobs_tree.grid(row=0, column=0, columnspan=2, sticky="ew")
+
+        self.cancel_job_button = ttk.Button(jobs_frame, text="Cancel Selected", command=self.cancel_selected_jobs)
+        self.cancel_job_button.grid(row=1, column=0, pady=(5, 0), sticky="ew")
+        self.cancel_all_button = ttk.Button(jobs_frame, text="Cancel All", command=self.job_queue.cancel_all)
+        self.cancel_all_button.grid(row=1, column=1, pady=(5, 0), sticky="ew")
+        jobs_frame.grid_columnconfigure(0, weight=1)
+        jobs_frame.grid_columnconfigure(1, weight=1)
+
+        # Output Folder Selection
+        output_frame = ttk.LabelFrame(self, text="Output Folder", padding=(10, 5))
+        output_frame.grid(row=7, column=0, columnspan=2, pady=(10, 5), sticky="ew")
+
+        self.output_folder_var = tk.StringVar(value=DOWNLOADS_FOLDER)
+        self.output_folder_label = ttk.Label(output_frame, textvariable=self.output_folder_var, wraplength=250, anchor=tk.W)
+        self.output_folder_label.grid(row=0, column=0, padx=(0, 5), sticky="ew")
+
+        self.browse_output_button = ttk.Button(output_frame, text="Browse", command=self.browse_output_folder)
+        self.browse_output_button.grid(row=0, column=1, sticky="e")
+
+        # Mirrors a whole folder tree into the output folder, converting only what changed
+        self.build_tree_button = ttk.Button(output_frame, text="Convert Folder Tree...", command=self.convert_folder_tree)
+        self.build_tree_button.grid(row=1, column=0, columnspan=2, pady=(5, 0), sticky="ew")
+        output_frame.grid_columnconfigure(0, weight=1) # Allow label to expand
+
+        # Flaticon Button
+        self.browser_button = ttk.Button(self, text="Find Icons (Flaticon)", command=self.open_browser)
+        self.browser_button.grid(row=8, column=0, columnspan=2, pady=5, sticky="ew")
+
+        # Buy Me a Coffee Button
+        self.coffee_button = ttk.Button(self, text="☕ Buy Me a Coffee", command=self.open_coffee_link, style='Accent.TButton')
+        self.coffee_button.grid(row=9, column=0, columnspan=2, pady=5, sticky="ew")
+
+        # Auto-Delete Option
+        self.auto_delete_var = tk.BooleanVar(value=True)
+        self.auto_delete_check = ttk.Checkbutton(
+            self,
+            text="Delete original PNG from Downloads after loading?",
+            variable=self.auto_delete_var,
+            style='TCheckbutton' # Apply style if needed
+        )
+        self.auto_delete_check.grid(row=10, column=0, columnspan=2, pady=(10, 0), sticky="w")
+
+        # Auto-Convert Option
+        self.auto_convert_var = tk.BooleanVar(value=True)
+        self.auto_convert_check = ttk.Checkbutton(
+            self,
+            text="Convert new downloads automatically",
+            variable=self.auto_convert_var,
+            style='TCheckbutton'
+        )
+        self.auto_convert_check.grid(row=11, column=0, columnspan=2, pady=(5, 0), sticky="w")
+
+        # Status Bar
+        self.status_var = tk.StringVar(value="Ready.")
+        status_bar = ttk.Label(self, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W, style='Status.TLabel')
+        status_bar.grid(row=12, column=0, columnspan=2, pady=(15, 0), sticky="ew")
+
+        # --- Start Download Monitoring ---
+        # Check if downloads folder exists before starting thread
+        if os.path.isdir(DOWNLOADS_FOLDER):
+            self.monitor_thread = threading.Thread(target=self.monitor_downloads, daemon=True)
+            self.monitor_thread.start()
+        else:
+            msg = f"Downloads folder not found:\n{DOWNLOADS_FOLDER}\nAutomatic loading disabled."
+            self.update_status("Error: Downloads folder missing.")
+            messagebox.showwarning("Setup Warning", msg)
+
+
+    def _configure_styles(self):
+        """Padding/font styles, applied with or without ttkthemes."""
+        self.style.configure('TButton', padding=6, font=('Segoe UI', 9)) # Example font
+        self.style.configure('TLabel', padding=5, font=('Segoe UI', 9))
+        self.style.configure('Bold.TLabel', font=('Segoe UI', 12, 'bold'))
+        self.style.configure('TCombobox', padding=5, font=('Segoe UI', 9))
+        self.style.configure('TCheckbutton', font=('Segoe UI', 9))
+        self.style.configure('Status.TLabel', padding=3, font=('Segoe UI', 8))
+
+    def _apply_theme(self):
+        """Switches to the ttkthemes theme if the package is installed."""
+        try:
+            from ttkthemes import ThemedStyle
+        except ImportError:
+            log.info("ttkthemes not found, using default Tkinter style.")
+            return
+        try:
+            ThemedStyle(self).set_theme(THEME)
+        except tk.TclError as e:
+            log.warning(f"Could not apply theme {THEME}: {e}")
+            return
+        # Style options belong to a theme, so set them again on the new one
+        self._configure_styles()
+
+    def update_status(self, message):
+        """Safely updates the status bar text from any thread."""
+        # Schedule the update on the main Tkinter thread
+        self.after(0, self.status_var.set, message)
+        # self.update_idletasks() # Generally not needed when using .after()
+
+    def browse_output_folder(self):
+        """Opens a directory dialog to select the output folder."""
+        selected_folder = filedialog.askdirectory(
+            title="Select Output Folder",
+            initialdir=self.output_folder_var.get() # Start in current selected folder
+        )
+        if selected_folder:
+            self.output_folder_var.set(selected_folder)
+            self.update_status(f"Output folder set to: {os.path.basename(selected_folder)}")
+        else:
+            self.update_status("Output folder selection cancelled.")
+
+    def _toggle_size_dropdown_state(self):
+        """Enables or disables the size dropdown based on the 'generate all sizes' checkbox."""
+        if self.generate_all_sizes_var.get():
+            self.size_dropdown.config(state=tk.DISABLED)
+        else:
+            self.size_dropdown.config(state="readonly")
+
+    def select_image(self):
+        """Opens a file dialog to select a PNG image."""
+        file_path = filedialog.askopenfilename(
+            title="Select PNG Image",
+            filetypes=[("PNG files", "*.png"), ("All files", "*.*")]
+        )
+        if file_path:
+            self.process_image(file_path, source="selection") # Indicate source
+        else:
+            self.update_status("Image selection cancelled.")
+
+    def process_image(self, file_path, source="manual"): # Default source
+        """Loads, validates, stores, and displays the PNG image."""
+        self.update_status(f"Processing {os.path.basename(file_path)}...")
+        try:
+            # Validates from the PNG header only; raises FileNotFoundError /
+            # ValueError for missing or non-PNG files. The raw bytes are only
+            # kept when they can be embedded as an exact-size frame.
+            loader = LazyPng(file_path)
+
+            # --- Key Change: Store the PIL Image object ---
+            # Decoded once and reduced straight to what a 256px ICO needs, so
+            # a huge source never stays in memory at full resolution.
+            self.loaded_pil_image = loader.image
+            self.loaded_png_bytes = loader.png_bytes
+
+            # Store the original path for output naming
+            self.current_file_path = file_path
+
+            # Create preview thumbnail *from the reduced working image*
+            preview_image = loader.preview((200, 200))
+            from PIL import ImageTk # Loaded with the first preview, not at startup
+            self.current_image_preview = ImageTk.PhotoImage(preview_image)
+
+            # Update UI
+            self.preview_label.config(image=self.current_image_preview, text="")
+            self.convert_button['state'] = tk.NORMAL
+            self.update_status(f"Loaded: {os.path.basename(file_path)}")
+
+            # --- Auto-delete logic (can now happen immediately) ---
+            if source == "download" and self.auto_delete_var.get():
+                # We have the image data in self.loaded_pil_image, so deleting
+                # the original file now is safe for conversion.
+                self.delete_downloaded_file(file_path)
+
+        except FileNotFoundError as fnf_err:
+             METRICS.count_error(fnf_err)
+             error_msg = f"Error: {fnf_err}"
+             log.error(error_msg)
+             self.update_status(error_msg)
+             messagebox.showerror("Error", f"The file\n{file_path}\ncould not be found. It might have been moved or deleted before processing.")
+             self.reset_ui() # Reset state
+        except ValueError as ve:
+            METRICS.count_error(ve)
+            error_msg = f"Invalid File: {ve}"
+            log.error(error_msg)
+            self.update_status(f"Error: {ve}")
+            messagebox.showerror("Invalid File", str(ve))
+            self.reset_ui()
+        except Exception as e:
+            METRICS.count_error(e)
+            error_msg = f"Could not load or process the image:\n{e}"
+            log.error(f"Image processing error: {e}")
+            self.update_status(f"Error loading image: {e}")
+            messagebox.showerror("Image Error", error_msg)
+            self.reset_ui()
+
+
+    def reset_ui(self):
+        """Resets the UI and internal state when no image is loaded or an error occurs."""
+        self.preview_label.config(image='', text="No Image Selected")
+        self.current_image_preview = None
+        self.current_file_path = None
+        self.loaded_pil_image = None # <<< Clear the stored PIL image
+        self.loaded_png_bytes = None
+        self.convert_button['state'] = tk.DISABLED
+        self.update_status("Ready.") # Optionally reset status
+
+    def delete_downloaded_file(self, file_path):
+        """Attempts to delete the specified file from Downloads."""
+        if not file_path or not file_path.startswith(DOWNLOADS_FOLDER):
+             log.info(f"Skipping deletion for file outside Downloads: {file_path}")
+             return # Safety check
+
+        try:
+            log.info(f"Attempting to delete: {file_path}")
+            with span("delete"):
+                os.remove(file_path)
+            self.update_status(f"Deleted original: {os.path.basename(file_path)}")
+            log.info(f"Successfully deleted: {file_path}")
+        except OSError as e:
+            error_msg = f"Could not delete {os.path.basename(file_path)}:\n{e}\nCheck file permissions or if it's in use."
+            self.update_status(f"Error deleting file: {e}")
+            log.warning(error_msg)
+            messagebox.showwarning("Deletion Error", error_msg)
+        except Exception as e:
+             error_msg = f"An unexpected error occurred during deletion:\n{e}"
+             self.update_status(f"Error deleting file: {e}")
+             log.warning(error_msg)
+             messagebox.showwarning("Deletion Error", error_msg)
+
+    def convert_png_to_ico(self):
+        """Converts the in-memory PNG image to an ICO file."""
+        # --- Key Change: Check for the loaded PIL image ---
+        if not self.loaded_pil_image:
+            messagebox.showwarning("No Image Data", "Please load a PNG image first.")
+            self.update_status("Conversion failed: No image loaded.")
+            return
+        # We still need the original path for naming the output
+        if not self.current_file_path:
+             messagebox.showerror("Internal Error", "Cannot determine output filename.")
+             self.update_status("Conversion failed: Missing original path.")
+             return
+
+        try:
+            # Determine sizes for ICO (shared with the headless batch mode)
+            ico_sizes, name_suffix = resolve_sizes(self.size_var.get(), self.generate_all_sizes_var.get())
+        except ValueError as ve:
+            error_msg = f"Conversion Error: {ve}"
+            log.error(error_msg)
+            self.update_status(error_msg)
+            messagebox.showerror("Conversion Error", str(ve))
+            return
+
+        # Snapshot everything the worker needs; Tk variables are main-thread only
+        img_to_convert = self.loaded_pil_image # No need to reopen file
+        png_bytes = self.loaded_png_bytes
+        output_dir = self.output_folder_var.get() # Use the selected output folder
+        ico_filename = ico_filename_for(self.current_file_path, name_suffix)
+        ico_path = os.path.join(output_dir, ico_filename)
+
+        def run(report):
+            save_ico(img_to_convert, ico_path, ico_sizes, cache=self.conversion_cache,
+                     source_png=png_bytes, progress=report)
+            return ico_path
+
+        job = self.job_queue.submit(ico_filename, run)
+        self._job_meta[job.id] = {"interactive": True}
+        self.update_status(f"Queued: {ico_filename}")
+
+    def queue_download_conversion(self, file_path):
+        """Converts a detected download in the background with the current settings."""
+        try:
+            ico_sizes, name_suffix = resolve_sizes(self.size_var.get(), self.generate_all_sizes_var.get())
+        except ValueError as ve:
+            self.update_status(f"Conversion Error: {ve}")
+            return
+        output_dir = self.output_folder_var.get()
+        ico_filename = ico_filename_for(file_path, name_suffix)
+        ico_path = os.path.join(output_dir, ico_filename)
+        delete_after_load = self.auto_delete_var.get()
+
+        def run(report):
+            report(0.05, "Loading...")
+            source = LazyPng(file_path, max_icon_edge=max(max(size) for size in ico_sizes))
+            save_ico(source.image, ico_path, ico_sizes, cache=self.conversion_cache,
+                     source_png=source.png_bytes, progress=report)
+            if delete_after_load:
+                # Only once the ICO is written; a cancelled or failed job keeps the download
+                self.after(0, self.delete_downloaded_file, file_path)
+            return ico_path
+
+        job = self.job_queue.submit(ico_filename, run)
+        self._job_meta[job.id] = {"interactive": False}
+
+    def convert_folder_tree(self):
+        """Mirrors a folder of PNGs (with sub-folders) into the output folder as ICOs."""
+        source_root = filedialog.askdirectory(title="Select Folder of PNG Images")
+        if not source_root:
+            self.update_status("Folder selection cancelled.")
+            return
+        # Snapshot the settings; Tk variables are main-thread only
+        output_root = self.output_folder_var.get()
+        size_str = self.size_var.get()
+        all_sizes = self.generate_all_sizes_var.get()
+        cache_dir = self.conversion_cache.root if self.conversion_cache else None
+        from ico_build import run_build # Pulls in the batch/optimizer modules; only needed here
+
+        def run(report):
+            ok_count, failures, plan = run_build(source_root, output_root, size_str, all_sizes,
+                                                 workers=1, cache_dir=cache_dir, report=log.info,
+                                                 progress=report)
+            summary = (f"{ok_count} converted, {plan.unchanged} already up to date, "
+                       f"{len(plan.orphans)} removed")
+            if failures:
+                summary += f", {len(failures)} failed (first: {failures[0][1]})"
+            return f"{summary}\nOutput folder:\n{output_root}"
+
+        job = self.job_queue.submit(f"{os.path.basename(source_root)} (folder)", run)
+        self._job_meta[job.id] = {"interactive": True, "folder": True}
+        self.update_status(f"Queued folder: {source_root}")
+
+    # --- Job Queue ---
+    def _on_job_update(self, job):
+        """Called from any thread when a job changes; coalesces redraws."""
+        with self._job_lock:
+            self._dirty_jobs.add(job.id)
+            if self._job_refresh_scheduled:
+                return
+            self._job_refresh_scheduled = True
+        # Many jobs reporting at once still cost one redraw per JOB_REFRESH_MS
+        self.after(JOB_REFRESH_MS, self._flush_job_updates)
+
+    def _flush_job_updates(self):
+        """Redraws changed jobs in the list and announces finished ones (main thread)."""
+        with self._job_lock:
+            dirty = sorted(self._dirty_jobs)
+            self._dirty_jobs.clear()
+            self._job_refresh_scheduled = False
+
+        for job_id in dirty:
+            job = self.job_queue.jobs.get(job_id)
+            if job is None:
+                continue
+            iid = str(job.id)
+            values = (job.state, f"{int(job.progress * 100)}")
+            if self.jobs_tree.exists(iid):
+                self.jobs_tree.item(iid, values=values)
+            else:
+                self.jobs_tree.insert("", tk.END, iid=iid, text=job.name, values=values)
+            if job.finished and job.id in self._job_meta:
+                self._announce_job(job, self._job_meta.pop(job.id))
+
+        for job_id in self.job_queue.forget_finished(keep=MAX_FINISHED_JOBS):
+            if self.jobs_tree.exists(str(job_id)):
+                self.jobs_tree.delete(str(job_id))
+
+    def _announce_job(self, job, meta):
+        """Reports a finished job in the status bar (and a dialog for manual conversions)."""
+        pending = self.job_queue.pending_count()
+        suffix = f" ({pending} job(s) remaining)" if pending else ""
+        if job.state == DONE:
+            log.info(f"Saved: {job.result}")
+            self.update_status(f"Saved: {job.name}{suffix}")
+            if meta.get("folder"):
+                messagebox.showinfo("Folder Converted", job.result)
+            elif meta["interactive"]:
+                messagebox.showinfo("Success", f"Image successfully converted!\nSaved as:\n{job.result}")
+        elif job.state == FAILED:
+            METRICS.count_error(job.error)
+            log.error(f"Conversion/Save error for {job.name}: {job.error}")
+            self.update_status(f"Conversion Error: {job.error}{suffix}")
+            if meta["interactive"]:
+                if isinstance(job.error, ValueError):
+                    messagebox.showerror("Conversion Error", str(job.error))
+                else:
+                    messagebox.showerror("Conversion Error", f"Could not convert or save the ICO file:\n{job.error}")
+        else:
+            self.update_status(f"Cancelled: {job.name}{suffix}")
+
+    def cancel_selected_jobs(self):
+        """Cancels the jobs selected in the list."""
+        for iid in self.jobs_tree.selection():
+            self.job_queue.cancel(int(iid))
+
+    def _on_close(self):
+        """Stops queued conversions before closing the window."""
+        self.job_queue.shutdown()
+        self.destroy()
+
+    def open_browser(self):
+        """Opens Flaticon in the default web browser."""
+        self.update_status("Opening Flaticon...")
+        try:
+            import webbrowser
+            webbrowser.open("https://www.flaticon.com/")
+            # Don't reset status immediately, let user see it opened
+            # self.after(1500, self.update_status, "Ready.") # Optional delayed reset
+        except Exception as e:
+            error_msg = f"Could not open the web browser:\n{e}"
+            self.update_status(f"Error opening browser: {e}")
+            log.error(error_msg)
+            messagebox.showerror("Browser Error", error_msg)
+
+    def open_coffee_link(self):
+        """Opens Buy Me a Coffee page in the default web browser."""
+        self.update_status("Opening Buy Me a Coffee...")
+        try:
+            import webbrowser
+            webbrowser.open("https://buymeacoffee.com/bariselcii")
+        except Exception as e:
+            error_msg = f"Could not open the web browser:\n{e}"
+            self.update_status(f"Error opening browser: {e}")
+            log.error(error_msg)
+            messagebox.showerror("Browser Error", error_msg)
+
+    # --- Download Monitoring ---
+    def monitor_downloads(self):
+        """Monitors the Downloads folder for new PNG files."""
+        log.info(f"Starting download monitor for: {DOWNLOADS_FOLDER}")
+        from ico_watch import FolderWatcher # Imported on the monitor thread, off the startup path
+        while True:
+            try:
+                # inotify on Linux, incremental scandir elsewhere. Files are only
+                # reported once fully written, every file of a burst in order.
+                watcher = FolderWatcher(DOWNLOADS_FOLDER, self._on_new_download)
+                log.info(f"Download monitor using {watcher.backend.name} backend.")
+                watcher.run()
+                break
+            except FileNotFoundError:
+                err_msg = f"Downloads folder {DOWNLOADS_FOLDER} not found or inaccessible."
+                log.error(err_msg)
+                self.update_status(f"Error: {err_msg}")
+                break # Stop monitoring if folder vanishes
+            except OSError as e:
+                # Permissions error, etc.
+                log.warning(f"Error scanning Downloads folder: {e}")
+                self.update_status(f"Warning: Error scanning Downloads ({e})")
+                # Continue monitoring, might be temporary
+                time.sleep(MONITOR_RETRY_SECONDS)
+            except Exception as e:
+                log.exception(f"Unexpected error in monitoring thread: {e}")
+                time.sleep(MONITOR_RETRY_SECONDS)
+
+    def _on_new_download(self, file_path):
+        """Called from the monitor thread for each new, fully written PNG."""
+        log.info(f"Detected new PNG: {os.path.basename(file_path)}")
+        # Schedule on the main thread, which owns the Tk settings variables
+        self.after(0, self._handle_new_download, file_path)
+
+    def _handle_new_download(self, file_path):
+        """Queues a detected download for conversion, or loads it for preview."""
+        if self.auto_convert_var.get():
+            # Every download gets its own job, so a burst converts in parallel
+            # instead of each file replacing the previously loaded image.
+            self.queue_download_conversion(file_path)
+        else:
+            # Pass source="download" to enable potential deletion
+            self.process_image(file_path, "download")
+
+
+# --- Main Execution ---
+def main():
+    """Runs the desktop app until its window is closed."""
+    # Diagnostics go through logging; metrics/profiling are opt-in via PNGTOICO_* variables
+    setup_logging()
+    configure_from_env()
+    app = PngToIcoConverter()
+    app.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
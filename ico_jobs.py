@@ -0,0 +1,136 @@
+"""Background job queue for conversions started from the GUI.
+
+Jobs run on a small thread pool (Pillow releases the GIL while resizing
+and encoding). Every state or progress change is reported through the
+`on_update(job)` callback from the worker thread; the GUI marshals those
+onto the Tk main loop with after(). Cancelling a queued job removes it
+outright; a running job stops at its next progress checkpoint.
+"""
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "Queued"
+RUNNING = "Running"
+DONE = "Done"
+FAILED = "Failed"
+CANCELLED = "Cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's function when the job has been cancelled."""
+
+
+class Job:
+    """One unit of work plus its observable state."""
+
+    def __init__(self, job_id, name, func):
+        self.id = job_id
+        self.name = name
+        self.func = func
+        self.state = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self._cancel_event = threading.Event()
+        self._future = None
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+
+class JobQueue:
+    """Runs submitted jobs on `workers` threads and reports their progress."""
+
+    def __init__(self, on_update, workers=DEFAULT_WORKERS):
+        self.on_update = on_update
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="convert")
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.jobs = {} # job id -> Job, in submission order
+
+    def submit(self, name, func):
+        """Queues `func(report)` and returns its Job.
+
+        `report(fraction, message)` updates progress and raises JobCancelled
+        once the job has been cancelled, so it doubles as a checkpoint.
+        """
+        job = Job(next(self._ids), name, func)
+        with self._lock:
+            self.jobs[job.id] = job
+        self.on_update(job)
+        job._future = self._pool.submit(self._run, job)
+        return job
+
+    def cancel(self, job_id):
+        """Cancels a job. Returns False if it had already finished."""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel_event.set()
+        if job._future is not None and job._future.cancel():
+            # Never started; _run will not be called for it
+            self._finish(job, CANCELLED, "Cancelled")
+        return True
+
+    def cancel_all(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+
+    def forget_finished(self, keep=0):
+        """Drops finished jobs from `jobs`, keeping the newest `keep` of them."""
+        with self._lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+            dropped = finished[:max(len(finished) - keep, 0)]
+            for job_id in dropped:
+                del self.jobs[job_id]
+            return dropped
+
+    def pending_count(self):
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    def shutdown(self):
+        """Cancels everything still queued and stops accepting work."""
+        self.cancel_all()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job):
+        if job.cancelled:
+            self._finish(job, CANCELLED, "Cancelled")
+            return
+        job.state = RUNNING
+        self.on_update(job)
+
+        def report(fraction, message=""):
+            if job.cancelled:
+                raise JobCancelled()
+            job.progress = fraction
+            if message:
+                job.message = message
+            self.on_update(job)
+
+        try:
+            job.result = job.func(report)
+        except JobCancelled:
+            self._finish(job, CANCELLED, "Cancelled")
+        except Exception as e:
+            job.error = e
+            self._finish(job, FAILED, str(e))
+        else:
+            job.progress = 1.0
+            self._finish(job, DONE, "Done")
+
+    def _finish(self, job, state, message):
+        job.state = state
+        job.message = message
+        self.on_update(job)
@@ -0,0 +1,97 @@
+"""Low-memory PNG loading for conversion and previews.
+
+PNG has no reduced-resolution decode (Image.draft only helps JPEG), so the
+full image still has to be decoded once. What this avoids is keeping it:
+the file is validated from its header alone, and on first use the decoded
+pixels are immediately box-reduced to the working base the resize pyramid
+needs for the largest ICO frame. The full-resolution buffer is dropped
+right away, so only a <=768px base stays alive, plus the compressed bytes
+when the file itself could be embedded as an ICO frame.
+"""
+import io
+import os
+from PIL import Image, UnidentifiedImageError
+
+from ico_file import png_passthrough_ok, png_size
+from ico_metrics import count, span
+from ico_resize import MAX_ICON_EDGE, QUALITY_GAP, fit_size, normalize_mode, reduce_towards
+
+PREVIEW_SIZE = (200, 200)
+
+
+class LazyPng:
+    """A PNG on disk that is validated now and decoded only when needed.
+
+    Pass `png_bytes` for a PNG that is already in memory (e.g. an upload);
+    `file_path` is then only used as its name.
+    """
+
+    def __init__(self, file_path, max_icon_edge=MAX_ICON_EDGE, png_bytes=None):
+        self.path = file_path
+        self.max_icon_edge = max_icon_edge
+        if png_bytes is None:
+            if not os.path.exists(file_path):
+                # Handle case where file disappears between detection and processing
+                raise FileNotFoundError(f"File not found during processing: {file_path}")
+            with open(file_path, 'rb') as f:
+                png_bytes = f.read()
+        count("bytes_in_total", len(png_bytes))
+        # Kept only if ico_file could embed the file as an exact-size frame;
+        # otherwise the header below holds them until the pixels are decoded
+        self.png_bytes = None
+        if png_passthrough_ok(png_bytes) and max(png_size(png_bytes)) <= max_icon_edge:
+            self.png_bytes = png_bytes
+        # Image.open only parses the header; no pixels are decoded here
+        try:
+            header = Image.open(io.BytesIO(png_bytes))
+        except UnidentifiedImageError:
+            raise ValueError("Selected file is not a valid PNG.")
+        # Ensure it's actually a PNG
+        if header.format != 'PNG':
+            header.close()
+            raise ValueError("Selected file is not a valid PNG.")
+        self.size = header.size
+        self.mode = header.mode
+        self._header = header
+        self._image = None
+
+    @property
+    def image(self):
+        """Decoded working image, reduced to what the largest ICO frame needs."""
+        if self._image is None:
+            with span("decode"):
+                full = self._header
+                try:
+                    full.load()
+                except MemoryError:
+                    raise
+                except Exception as e:
+                    # Pillow reports damaged data as SyntaxError, zlib.error, OSError...
+                    raise ValueError("Selected file is not a valid PNG.") from e
+                full = normalize_mode(full)
+                # Same integer box reduction the pyramid applies for a 256px frame,
+                # so all-sizes output matches decoding from the full image.
+                target = fit_size(full.size, (self.max_icon_edge, self.max_icon_edge))
+                self._image = reduce_towards(full, target, QUALITY_GAP)
+            # Drop the full-resolution buffer (unless nothing was reduced)
+            self._header = None
+            del full
+        return self._image
+
+    def preview(self, box=PREVIEW_SIZE):
+        """Returns a small thumbnail built from the reduced working image."""
+        base = self.image
+        with span("thumbnail"):
+            preview = reduce_towards(base, fit_size(base.size, box), 2.0)
+            if preview is base:
+                preview = base.copy()
+            preview.thumbnail(box, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        return preview
+
+    def close(self):
+        """Releases the decoded pixels and the in-memory file bytes."""
+        if self._header is not None:
+            self._header.close()
+        self._header = None
+        self._image = None
+        self.png_bytes = None
@@ -0,0 +1,282 @@
+"""Timing spans, counters and structured logging for the conversion pipeline.
+
+Everything is off by default and then costs one attribute check per call:
+span() hands back a shared no-op context manager and count() returns
+immediately. Enable with configure() or the environment:
+
+    PNGTOICO_METRICS=metrics.prom      file the metrics are dumped to
+    PNGTOICO_METRICS_FORMAT=prom|jsonl Prometheus text (default) or JSON lines
+    PNGTOICO_METRICS_INTERVAL=10       seconds between dumps
+    PNGTOICO_PROFILE=convert.prof      cProfile the next single conversion
+    PNGTOICO_LOG=debug                 log level; debug also logs every span
+    PNGTOICO_LOG_JSON=1                one JSON object per log line
+"""
+import atexit
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from ico_file import write_atomic
+
+FORMAT_PROMETHEUS = "prom"
+FORMAT_JSONL = "jsonl"
+METRICS_FORMATS = [FORMAT_PROMETHEUS, FORMAT_JSONL]
+DEFAULT_DUMP_INTERVAL = 10.0
+_PREFIX = "pngtoico_"
+
+log = logging.getLogger("pngtoico")
+
+
+class _NullSpan:
+    """Shared do-nothing span returned while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Times one stage and records it in the registry on exit."""
+
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Process-wide registry of stage timings and labelled counters."""
+
+    def __init__(self):
+        self.enabled = False
+        self.profile_path = None
+        self._lock = threading.Lock()
+        self._counters = {}   # (name, ((label, value), ...)) -> number
+        self._timings = {}    # stage -> [count, total_seconds, max_seconds]
+
+    # --- Recording ---
+    def span(self, name):
+        """Context manager timing the stage `name` (decode, resize, encode, ...)."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name, seconds):
+        """Records an already measured duration for stage `name`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._timings.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"span {name} took {seconds * 1000:.2f} ms",
+                      extra={"fields": {"stage": name, "seconds": round(seconds, 6)}})
+
+    def count(self, name, value=1, **labels):
+        """Adds `value` to the counter `name` with the given labels."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def count_error(self, error):
+        """Counts an exception under errors_total{type=...}."""
+        self.count("errors_total", type=type(error).__name__)
+
+    # --- Snapshots (used to ship worker-process metrics to the parent) ---
+    def drain(self):
+        """Returns everything recorded so far and resets the registry."""
+        with self._lock:
+            snapshot = (self._counters, self._timings)
+            self._counters, self._timings = {}, {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """Adds a snapshot produced by drain() in another process."""
+        if not self.enabled or not snapshot:
+            return
+        counters, timings = snapshot
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, (n, total, peak) in timings.items():
+                stats = self._timings.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += n
+                stats[1] += total
+                stats[2] = max(stats[2], peak)
+
+    # --- Output ---
+    def to_prometheus(self):
+        """Renders the registry in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timings = sorted(self._timings.items())
+        lines = []
+        seen_types = set()
+        for (name, labels), value in counters:
+            metric = _PREFIX + name
+            if metric not in seen_types:
+                lines.append(f"# TYPE {metric} counter")
+                seen_types.add(metric)
+            lines.append(f"{metric}{_labels(labels)} {value}")
+        if timings:
+            lines.append(f"# TYPE {_PREFIX}stage_seconds summary")
+            for name, (n, total, _peak) in timings:
+                lines.append(f'{_PREFIX}stage_seconds_count{{stage="{name}"}} {n}')
+                lines.append(f'{_PREFIX}stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f"# TYPE {_PREFIX}stage_seconds_max gauge")
+            for name, (_n, _total, peak) in timings:
+                lines.append(f'{_PREFIX}stage_seconds_max{{stage="{name}"}} {peak:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """Returns the registry as plain JSON-serialisable data."""
+        with self._lock:
+            counters = {name + _labels(labels): value for (name, labels), value in self._counters.items()}
+            stages = {name: {"count": n, "sum_s": round(total, 6), "max_s": round(peak, 6)}
+                      for name, (n, total, peak) in self._timings.items()}
+        return {"ts": time.time(), "counters": counters, "stages": stages}
+
+    def dump(self, path, fmt=FORMAT_PROMETHEUS):
+        """Writes the current metrics: Prometheus replaces the file, JSON lines appends."""
+        if fmt == FORMAT_JSONL:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.to_dict()) + "\n")
+            return
+        # Scrapers never see a half-written file. The textfile collector usually
+        # runs as another user, so the file gets the normal 0666-minus-umask mode.
+        write_atomic(path, self.to_prometheus().encode("utf-8"))
+
+    # --- Profiling ---
+    @contextmanager
+    def maybe_profile(self):
+        """cProfiles the enclosed block if a profile was requested, then disarms."""
+        path = self.profile_path
+        if path is None:
+            yield
+            return
+        self.profile_path = None # Only one conversion is profiled
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            log.info(f"Profile written to {path}", extra={"fields": {"path": path}})
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + inner + "}"
+
+
+METRICS = Metrics()
+span = METRICS.span
+count = METRICS.count
+
+
+class _Dumper(threading.Thread):
+    """Background thread writing the metrics file every `interval` seconds."""
+
+    def __init__(self, path, fmt, interval):
+        super().__init__(name="metrics-dumper", daemon=True)
+        self.path, self.fmt, self.interval = path, fmt, interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        try:
+            METRICS.dump(self.path, self.fmt)
+        except OSError as e:
+            log.warning("could not write metrics file %s: %s", self.path, e)
+
+    def stop(self):
+        self._stop_event.set()
+        self.flush()
+
+
+_dumper = None
+
+
+def configure(metrics_path=None, fmt=FORMAT_PROMETHEUS, interval=DEFAULT_DUMP_INTERVAL,
+              profile_path=None, enabled=None):
+    """Turns metrics on and starts the periodic dump to `metrics_path`."""
+    global _dumper
+    if fmt not in METRICS_FORMATS:
+        raise ValueError(f"Unknown metrics format: {fmt}")
+    METRICS.enabled = bool(metrics_path or profile_path) if enabled is None else enabled
+    METRICS.profile_path = profile_path
+    if _dumper is not None:
+        _dumper.stop()
+        _dumper = None
+    if metrics_path:
+        _dumper = _Dumper(metrics_path, fmt, interval)
+        _dumper.start()
+        atexit.register(_dumper.stop)
+
+
+def configure_from_env(environ=os.environ):
+    """Applies the PNGTOICO_* environment variables described above."""
+    configure(
+        metrics_path=environ.get("PNGTOICO_METRICS") or None,
+        fmt=environ.get("PNGTOICO_METRICS_FORMAT", FORMAT_PROMETHEUS),
+        interval=float(environ.get("PNGTOICO_METRICS_INTERVAL", DEFAULT_DUMP_INTERVAL)),
+        profile_path=environ.get("PNGTOICO_PROFILE") or None,
+    )
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any `extra={"fields": {...}}`."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def setup_logging(environ=os.environ):
+    """Configures the 'pngtoico' logger from PNGTOICO_LOG / PNGTOICO_LOG_JSON."""
+    level = getattr(logging, environ.get("PNGTOICO_LOG", "info").upper(), logging.INFO)
+    handler = logging.StreamHandler()
+    if environ.get("PNGTOICO_LOG_JSON"):
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    log.handlers[:] = [handler]
+    log.setLevel(level)
+    log.propagate = False
@@ -0,0 +1,165 @@
+"""Output size optimizer: trial-encodes every frame and keeps the smallest.
+
+The default ico_file encoding (PNG for 256px, 32-bit BMP below) favours
+compatibility over size. With an Optimizer each frame is additionally
+encoded as a 32-bit BMP, a 24-bit BMP with a 1-bit transparency mask, an
+8-bit palette BMP with the same mask, and PNG at several zlib levels and
+strategies, all in parallel on a thread pool (the encoders release the
+GIL). Lossy candidates are decoded again and only kept while no pixel is
+off by more than `max_error` levels. Trials check the per-file time budget
+before each step and give up once it has run out, so only encodes already
+under way finish after it, and encode() waits for them; whatever finished
+is used.
+The default encoding is always available.
+"""
+import io
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from PIL import Image
+
+from ico_file import BITMAPINFOHEADER, FORMAT_BMP, FORMAT_PNG, decode_frame, encode_bmp, encode_frames
+from ico_metrics import count
+from ico_resize import worst_error
+
+DEFAULT_MAX_ERROR = 0.0     # lossless unless asked otherwise
+DEFAULT_TIME_BUDGET = 2.0   # seconds per file
+MASK_THRESHOLD = 128        # alpha below this becomes transparent in masked BMPs
+
+
+# --- Candidate encoders ---
+def _and_mask(alpha, width):
+    """1-bit AND mask (1 = transparent), bottom-up with rows padded to 32 bits."""
+    stride = ((width + 31) // 32) * 4
+    mask = alpha.point(lambda a: 255 if a < MASK_THRESHOLD else 0).convert("1")
+    return mask, mask.tobytes("raw", "1", stride, -1)
+
+
+def encode_bmp_masked(frame, bpp):
+    """Encodes a frame as a 24-bit or 8-bit palette DIB with a 1-bit AND mask."""
+    frame = frame if frame.mode == "RGBA" else frame.convert("RGBA")
+    width, height = frame.size
+    mask, and_bits = _and_mask(frame.getchannel("A"), width)
+    # Masked pixels must be black so the XOR pass leaves the background alone
+    rgb = Image.new("RGB", frame.size)
+    rgb.paste(frame.convert("RGB"), mask=mask.point(lambda m: 255 - m))
+    stride = ((width * bpp + 31) // 32) * 4
+    palette = b""
+    colours_used = 0
+    if bpp == 8:
+        indexed = rgb.quantize(colors=256, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        # Only the colours actually used are stored (biClrUsed), not all 256
+        colours = indexed.getpalette()[:256 * 3]
+        colours_used = len(colours) // 3
+        # RGBQUAD entries are blue, green, red, reserved
+        palette = b"".join(bytes((colours[i + 2], colours[i + 1], colours[i], 0))
+                           for i in range(0, colours_used * 3, 3))
+        xor_bits = indexed.tobytes("raw", "P", stride, -1)
+    else:
+        xor_bits = rgb.tobytes("raw", "BGR", stride, -1)
+    header = BITMAPINFOHEADER.pack(
+        BITMAPINFOHEADER.size, width, height * 2, # height covers XOR + AND masks
+        1, bpp, 0, len(xor_bits) + len(and_bits), 0, 0, colours_used, 0)
+    return header + palette + xor_bits + and_bits
+
+
+def encode_png_with(frame, **params):
+    """Encodes a frame as PNG with explicit zlib settings (compress_level, compress_type)."""
+    buffer = io.BytesIO()
+    frame.save(buffer, format="PNG", **params)
+    return buffer.getvalue()
+
+
+# (name, format family, bits per pixel, lossless, encoder), cheapest first so
+# the most likely winners are in even when the time budget is short
+CANDIDATES = [
+    ("bmp32", FORMAT_BMP, 32, True, encode_bmp),
+    ("bmp24-mask", FORMAT_BMP, 24, False, lambda frame: encode_bmp_masked(frame, 24)),
+    ("png6", FORMAT_PNG, 32, True, lambda frame: encode_png_with(frame, compress_level=6)),
+    ("png9", FORMAT_PNG, 32, True, lambda frame: encode_png_with(frame, compress_level=9)),
+    ("bmp8-mask", FORMAT_BMP, 8, False, lambda frame: encode_bmp_masked(frame, 8)),
+    ("png9-filtered", FORMAT_PNG, 32, True,
+     lambda frame: encode_png_with(frame, compress_level=9, compress_type=zlib.Z_FILTERED)),
+    ("png9-rle", FORMAT_PNG, 32, True,
+     lambda frame: encode_png_with(frame, compress_level=9, compress_type=zlib.Z_RLE)),
+]
+
+
+# --- Optimizer ---
+class Optimizer:
+    """Picks the smallest acceptable encoding per frame and tallies the bytes saved."""
+
+    def __init__(self, max_error=DEFAULT_MAX_ERROR, time_budget=DEFAULT_TIME_BUDGET, max_workers=None):
+        self.max_error = max_error
+        self.time_budget = time_budget
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self.files = 0
+        self.bytes_before = 0 # default encodings
+        self.bytes_after = 0  # what was written instead
+
+    def encode(self, frames, formats=None, source_png=None):
+        """Drop-in replacement for ico_file.encode_frames. Returns [(size, bpp, data)].
+
+        A format forced through `formats` limits that frame to candidates of
+        the same family.
+        """
+        deadline = time.monotonic() + self.time_budget
+        formats = formats or {}
+        # The default encoding (including PNG passthrough) is the baseline
+        best = encode_frames(frames, formats, source_png, self.max_workers)
+        baseline_bytes = sum(len(data) for _size, _bpp, data in best)
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="optimize")
+        trials = []
+        for _name, family, bpp, lossless, encoder in CANDIDATES:
+            for index, frame in enumerate(frames):
+                forced = formats.get(max(frame.size))
+                if forced and forced != family:
+                    continue
+                trials.append((index, pool.submit(self._try, frame, bpp, lossless, encoder, deadline)))
+        wait([future for _index, future in trials], timeout=max(deadline - time.monotonic(), 0))
+        # Out of time: queued trials are dropped and running ones stop at their
+        # next deadline check. Waiting for them keeps their CPU time inside this
+        # file instead of competing with the next one.
+        pool.shutdown(wait=True, cancel_futures=True)
+
+        # Walk in submission order so ties always go to the cheaper candidate
+        for index, future in trials:
+            if future.cancelled() or future.exception() is not None:
+                continue
+            result = future.result()
+            if result is not None and len(result[2]) < len(best[index][2]):
+                best[index] = result
+
+        optimized_bytes = sum(len(data) for _size, _bpp, data in best)
+        with self._lock:
+            self.files += 1
+            self.bytes_before += baseline_bytes
+            self.bytes_after += optimized_bytes
+        count("optimize_bytes_saved_total", baseline_bytes - optimized_bytes)
+        return best
+
+    def _try(self, frame, bpp, lossless, encoder, deadline):
+        if time.monotonic() >= deadline:
+            return None
+        data = encoder(frame)
+        if not lossless:
+            # Checking a lossy candidate costs a decode; not worth it past the deadline
+            if time.monotonic() >= deadline:
+                return None
+            if worst_error(decode_frame(frame.size, bpp, data), frame) > self.max_error:
+                return None
+        return frame.size, bpp, data
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_before - self.bytes_after
+
+    def stats(self):
+        """One-line summary of what the optimizer saved so far."""
+        ratio = self.bytes_saved / self.bytes_before if self.bytes_before else 0.0
+        return (f"Optimizer: {self.files} files, {self.bytes_before / 1e3:.1f} KB -> "
+                f"{self.bytes_after / 1e3:.1f} KB ({ratio:.1%} saved)")
@@ -0,0 +1,203 @@
+"""Batched NumPy resize backend for many same-size sources (optional).
+
+build_frames_batch() builds the same frames as ico_resize.build_frames()
+for a list of images. Images of the same size and mode are stacked and
+resized together through the same pyramid, as matrix products with
+LANCZOS weights that match Pillow's. The weights for a (source size,
+target size) pair are computed once, stored as bands of an otherwise
+sparse matrix, and kept in a small LRU cache.
+
+Both passes run in premultiplied alpha (Pillow's RGBa), like Pillow's own
+resize, so colour under transparent pixels never bleeds into the edges.
+The vertical pass goes band by band over each image's uint8 rows, so the
+full-resolution float copy never has to exist. The horizontal pass is a
+single product over the whole stack. Without NumPy every image goes
+through ico_resize.build_frames instead.
+"""
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+from ico_metrics import count
+from ico_resize import _REDUCING_GAP, RESIZE_QUALITY, build_frames, normalize_mode, \
+    pyramid_plan, reduce_towards, target_sizes
+
+try:
+    import numpy as np
+except ImportError: # Optional: without it every image is resized by Pillow
+    np = None
+
+LANCZOS_SUPPORT = 3.0
+BAND_ROWS = 8                          # output rows/columns per weight band
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024 # weight cache budget
+
+
+def available():
+    """True when NumPy is installed and stacks are resized as matrix products."""
+    return np is not None
+
+
+def backend():
+    """Names the backend build_frames_batch resizes with; its frames differ slightly from Pillow's."""
+    return "numpy" if np is not None else "pillow"
+
+
+# --- Filter weights ---
+def lanczos_weights(src_len, dst_len):
+    """Dense (dst_len, src_len) LANCZOS weight matrix, computed the way Pillow does it."""
+    scale = src_len / dst_len
+    filter_scale = max(scale, 1.0)
+    support = LANCZOS_SUPPORT * filter_scale
+    centers = (np.arange(dst_len) + 0.5) * scale
+    first = np.maximum((centers - support + 0.5).astype(np.int64), 0)
+    last = np.minimum((centers + support + 0.5).astype(np.int64), src_len)
+    x = np.arange(src_len)
+    t = (x[None, :] - centers[:, None] + 0.5) / filter_scale
+    weights = np.sinc(t) * np.sinc(t / LANCZOS_SUPPORT)
+    weights[(x < first[:, None]) | (x >= last[:, None]) | (np.abs(t) >= LANCZOS_SUPPORT)] = 0.0
+    weights /= weights.sum(axis=1, keepdims=True)
+    return weights.astype(np.float32)
+
+
+def weight_bands(weights, channels=1):
+    """Splits a weight matrix into [(out_start, out_end, in_start, in_end, block)].
+
+    Each band covers BAND_ROWS outputs and only the inputs they read, so
+    the products skip the zeros. With `channels` > 1 each block is expanded
+    for interleaved pixels (RGBARGBA...) and transposed, to be applied from
+    the right to rows of pixels.
+    """
+    bands = []
+    for start in range(0, weights.shape[0], BAND_ROWS):
+        end = min(start + BAND_ROWS, weights.shape[0])
+        used = np.flatnonzero(weights[start:end].any(axis=0))
+        first, last = int(used[0]), int(used[-1]) + 1
+        block = weights[start:end, first:last]
+        if channels > 1:
+            block = np.kron(block.T, np.eye(channels, dtype=np.float32))
+            start, end, first, last = start * channels, end * channels, first * channels, last * channels
+        bands.append((start, end, first, last, np.ascontiguousarray(block)))
+    return bands
+
+
+class WeightCache:
+    """LRU cache of weight bands per (source size, target size, channels)."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, src_size, dst_size, channels):
+        """Returns (vertical bands, horizontal bands) for resizing src_size to dst_size."""
+        key = (src_size, dst_size, channels)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        # Computed outside the lock; two threads may both build a new entry
+        bands = (weight_bands(lanczos_weights(src_size[1], dst_size[1])),
+                 weight_bands(lanczos_weights(src_size[0], dst_size[0]), channels))
+        nbytes = sum(band[4].nbytes for axis in bands for band in axis)
+        count("resample_weight_misses_total")
+        with self._lock:
+            self.misses += 1
+            if key not in self._entries:
+                self._entries[key] = (bands, nbytes)
+                self.bytes += nbytes
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                _key, (_bands, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+        return bands
+
+
+WEIGHTS = WeightCache()
+
+
+# --- Resampling ---
+def resample_stack(pixels, size, cache=WEIGHTS):
+    """Resizes a list of same-shape (H, W, C) uint8 arrays to `size` (W, H).
+
+    Returns one (N, h, w, C) uint8 array. Alpha must already be
+    premultiplied; C is 3 or 4.
+    """
+    height, width, channels = pixels[0].shape
+    out_width, out_height = size
+    vertical, horizontal = cache.get((width, height), size, channels)
+    # Vertical pass, one image and one band at a time: only the rows a band
+    # reads are converted to float, so everything stays in cache
+    rows = np.empty((len(pixels), out_height, width * channels), np.float32)
+    for index, image in enumerate(pixels):
+        flat = image.reshape(height, width * channels)
+        for start, end, first, last, block in vertical:
+            np.matmul(block, flat[first:last].astype(np.float32), out=rows[index, start:end])
+    # Horizontal pass over every row of every image at once
+    rows = rows.reshape(len(pixels) * out_height, width * channels)
+    result = np.empty((rows.shape[0], out_width * channels), np.float32)
+    for start, end, first, last, block in horizontal:
+        np.matmul(rows[:, first:last], block, out=result[:, start:end])
+    np.add(result, 0.5, out=result)
+    np.clip(result, 0, 255, out=result)
+    return result.astype(np.uint8).reshape(len(pixels), out_height, out_width, channels)
+
+
+def _to_image(array, mode):
+    """uint8 (h, w, C) array back to an image; premultiplied RGBa becomes RGBA."""
+    height, width = array.shape[:2]
+    image = Image.frombuffer(mode, (width, height), np.ascontiguousarray(array), "raw", mode, 0, 1)
+    return image.convert("RGBA") if mode == "RGBa" else image.copy()
+
+
+def _build_stack(images, sizes, mode, cache):
+    """Frames for a list of same-size, same-mode images. Returns one frame list per image."""
+    gap = _REDUCING_GAP[mode]
+    bases = [reduce_towards(image, sizes[0], gap) for image in images]
+    alpha = bases[0].mode == "RGBA"
+    pixel_mode = "RGBa" if alpha else "RGB"
+    # Premultiplied once here; every frame of the pyramid is resized from these
+    stacks = [np.asarray(base.convert("RGBa") if alpha else base) for base in bases]
+    frames = [[] for _ in images]
+    levels = []
+    for size, parent in pyramid_plan(sizes, mode):
+        source = stacks if parent is None else levels[parent]
+        source_size = (source[0].shape[1], source[0].shape[0])
+        if source_size == size:
+            levels.append(source)
+            for index in range(len(images)):
+                frames[index].append(bases[index] if parent is None else frames[index][parent])
+            continue
+        level = resample_stack(source, size, cache)
+        levels.append(level)
+        for index in range(len(images)):
+            frames[index].append(_to_image(level[index], pixel_mode))
+    return frames
+
+
+def build_frames_batch(images, ico_sizes, mode=RESIZE_QUALITY, cache=WEIGHTS):
+    """build_frames() for many images; same-size images are resized together.
+
+    Returns one list of frames (largest first) per image, in input order.
+    """
+    if mode not in _REDUCING_GAP:
+        raise ValueError(f"Unknown resize mode: {mode}")
+    if np is None:
+        return [build_frames(image, ico_sizes, mode) for image in images]
+    images = [normalize_mode(image) for image in images]
+    groups = {}
+    for index, image in enumerate(images):
+        groups.setdefault((image.size, image.mode), []).append(index)
+    results = [None] * len(images)
+    for (image_size, _mode), indices in groups.items():
+        sizes = target_sizes(image_size, ico_sizes)
+        if not sizes:
+            for index in indices:
+                results[index] = []
+            continue
+        for index, frames in zip(indices, _build_stack([images[i] for i in indices], sizes, mode, cache)):
+            results[index] = frames
+    return results
@@ -0,0 +1,143 @@
+"""Resize pyramid used to build the frames of a multi-size ICO.
+
+Pillow's ICO writer thumbnails every requested size straight from the
+full-resolution source, so a 4096px PNG is LANCZOS-filtered seven times.
+Here the source is box-reduced once to just above the largest frame, and
+every smaller frame is resampled from the closest larger frame instead.
+"""
+import math
+from PIL import Image, ImageChops, ImageStat
+
+RESIZE_FAST = "fast"
+RESIZE_QUALITY = "quality"
+RESIZE_MODES = [RESIZE_FAST, RESIZE_QUALITY]
+
+# How much larger than its target an intermediate image must stay. With a gap
+# of 3 every frame stays within QUALITY_MAX_ERROR of direct LANCZOS even on
+# noisy photographic input (worst 1.37 on the benchmark corpus, checked by
+# `ico_bench.py quality`); a gap of 2 is cheaper and has no such bound.
+FAST_GAP = 2.0
+QUALITY_GAP = 3.0
+_REDUCING_GAP = {RESIZE_FAST: FAST_GAP, RESIZE_QUALITY: QUALITY_GAP}
+QUALITY_MAX_ERROR = 1.5 # visible_error() bound, in 0..255 levels; see ico_bench.py quality
+MAX_ICON_EDGE = 256     # largest frame an ICO can hold
+
+
+def fit_size(src_size, box):
+    """Returns the size Image.thumbnail() would give `src_size` inside `box`."""
+    # Mirrors Pillow's own aspect rounding so frame sizes match what the
+    # ICO plugin produced before the pyramid existed.
+    width, height = src_size
+    x, y = box
+    if x >= width and y >= height:
+        return width, height
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+def normalize_mode(image):
+    """Converts palette/greyscale/16-bit images to RGB(A) so they resample smoothly."""
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    has_alpha = image.mode in ("LA", "PA", "RGBa", "La") or "transparency" in image.info
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def target_sizes(src_size, ico_sizes, max_edge=MAX_ICON_EDGE):
+    """Frame sizes Pillow would write for `ico_sizes`, largest first, without duplicates.
+
+    `max_edge` can be raised for outputs other than ICO (e.g. 512px web icons).
+    """
+    width, height = src_size
+    sizes = set()
+    for size in ico_sizes:
+        # Pillow's ICO writer skips sizes larger than the source or above 256px (max_edge)
+        if size[0] > width or size[1] > height or size[0] > max_edge or size[1] > max_edge:
+            continue
+        sizes.add(fit_size(src_size, size))
+    return sorted(sizes, reverse=True)
+
+
+def reduce_towards(image, size, gap):
+    """Box-reduces `image` by an integer factor while staying `gap` times above `size`."""
+    factor_x = int(image.width / size[0] / gap)
+    factor_y = int(image.height / size[1] / gap)
+    if factor_x > 1 or factor_y > 1:
+        return image.reduce((max(factor_x, 1), max(factor_y, 1)))
+    return image
+
+
+def pyramid_plan(sizes, mode=RESIZE_QUALITY):
+    """Picks the source of every frame in `sizes` (largest first).
+
+    Returns [(size, parent)] where `parent` is the index in `sizes` of the
+    frame to resample from, or None for the reduced base. In fast mode each
+    frame comes from the next larger frame; in quality mode from the closest
+    frame at least 3x larger (or the base), which keeps every frame within
+    QUALITY_MAX_ERROR of direct LANCZOS.
+    """
+    gap = _REDUCING_GAP[mode]
+    plan = []
+    for index, size in enumerate(sizes):
+        parent = None
+        if mode == RESIZE_FAST and index:
+            parent = index - 1 # closest larger frame
+        else:
+            # sizes is largest-first, so walk it backwards to find the closest
+            # parent that is still far enough above the target
+            for candidate in range(index - 1, -1, -1):
+                if sizes[candidate][0] >= size[0] * gap and sizes[candidate][1] >= size[1] * gap:
+                    parent = candidate
+                    break
+        plan.append((size, parent))
+    return plan
+
+
+def build_frames(image, ico_sizes, mode=RESIZE_QUALITY, max_edge=MAX_ICON_EDGE):
+    """Builds every ICO frame from one shared pyramid (see pyramid_plan).
+
+    Returns a list of images, largest first, one per distinct frame size.
+    """
+    if mode not in _REDUCING_GAP:
+        raise ValueError(f"Unknown resize mode: {mode}")
+    image = normalize_mode(image)
+    sizes = target_sizes(image.size, ico_sizes, max_edge)
+    if not sizes:
+        return []
+
+    # One cheap integer box reduction from the source, shared by every frame
+    base = reduce_towards(image, sizes[0], _REDUCING_GAP[mode])
+    frames = []
+    for size, parent in pyramid_plan(sizes, mode):
+        source = base if parent is None else frames[parent]
+        if source.size == size:
+            frames.append(source)
+        else:
+            frames.append(source.resize(size, Image.Resampling.LANCZOS))
+    return frames
+
+
+def visible_error(frame, reference):
+    """Mean absolute per-channel difference in premultiplied alpha, 0..255.
+
+    Colour hidden under fully transparent pixels does not count.
+    """
+    return sum(ImageStat.Stat(_premultiplied_difference(frame, reference)).mean) / 4
+
+
+def worst_error(frame, reference):
+    """Largest per-channel difference of any pixel, premultiplied as in visible_error."""
+    return max(high for _low, high in _premultiplied_difference(frame, reference).getextrema())
+
+
+def _premultiplied_difference(frame, reference):
+    return ImageChops.difference(frame.convert("RGBA").convert("RGBa"),
+                                 reference.convert("RGBA").convert("RGBa"))
@@ -0,0 +1,348 @@
+"""Local PNG to ICO conversion service: python pngtoico.py serve run [--port 8765]
+
+    POST /convert?size=48x48            body: PNG bytes -> 200 image/x-icon
+    POST /convert?all_sizes=1&resize=fast
+    GET  /health                        JSON: workers, requests in flight, capacity
+    GET  /metrics                       Prometheus text (stage timings, counters)
+
+Connections are HTTP/1.1 keep-alive. Conversions run on a process pool
+whose workers are started and warmed up (Pillow plugins loaded, one
+conversion done) before the server accepts connections. At most
+`max_queue` conversions are admitted at once; anything beyond that is
+turned away immediately with 503 and Retry-After instead of queueing
+without bound. `pngtoico.py serve load` is a small keep-alive load
+generator for trying it out locally.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+import ico_core
+from ico_metrics import METRICS, count, log, setup_logging
+from ico_resize import RESIZE_MODES, RESIZE_QUALITY
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_UPLOAD = 64 * 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+DISCARD_CHUNK = 64 * 1024 # read size when dropping the body of a rejected upload
+DRAIN_TIMEOUT = 0.5 # seconds of silence that end a body sent without Content-Length
+ICO_CONTENT_TYPE = "image/x-icon"
+
+
+# --- Worker processes ---
+def _init_worker(metrics_enabled):
+    """Pool initializer: loads Pillow's plugins and runs one throwaway conversion."""
+    METRICS.enabled = metrics_enabled
+    buffer = io.BytesIO()
+    Image.new("RGBA", (64, 64), (255, 0, 0, 255)).save(buffer, format="PNG")
+    ico_core.convert_bytes(buffer.getvalue(), all_sizes=True)
+    METRICS.drain() # The warm-up must not show up in /metrics
+
+
+def _ping():
+    return os.getpid()
+
+
+def _convert(png_bytes, size_str, all_sizes, resize_mode):
+    """Worker entry point. Returns (ico_bytes, metrics snapshot)."""
+    ico_bytes = ico_core.convert_bytes(png_bytes, size_str, all_sizes, resize_mode)
+    return ico_bytes, METRICS.drain() if METRICS.enabled else None
+
+
+# --- Server ---
+class ConversionServer(ThreadingHTTPServer):
+    """HTTP server owning the worker pool and the admission limit."""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, max_queue=None, max_upload=DEFAULT_MAX_UPLOAD):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue or self.workers * 4
+        self.max_upload = max_upload
+        self.started = time.time()
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.pool = None
+        super().__init__(address, ConversionHandler) # Bind first: fail fast if the port is taken
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(METRICS.enabled,))
+        # Start every worker now so the first requests do not pay for it
+        for future in [self.pool.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def try_admit(self):
+        """Claims a conversion slot. False means the server is at capacity."""
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def health(self):
+        with self._lock:
+            in_flight = self._in_flight
+        return {"status": "ok", "workers": self.workers, "in_flight": in_flight,
+                "capacity": self.max_queue, "uptime_s": round(time.time() - self.started, 1)}
+
+    def server_close(self):
+        super().server_close()
+        if self.pool is not None: # None when binding the port failed
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """Routes /convert, /health and /metrics."""
+
+    protocol_version = "HTTP/1.1" # keep-alive; every response carries Content-Length
+    server_version = "pngtoico"
+    # Headers and body are separate writes; without TCP_NODELAY every
+    # keep-alive response stalls on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send(200, json.dumps(self.server.health()).encode(), "application/json")
+        elif path == "/metrics":
+            self._send(200, METRICS.to_prometheus().encode(), "text/plain; version=0.0.4")
+        else:
+            self._send_error(404, "Not found")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            # No usable length, so the body can't be skipped exactly: drop
+            # whatever arrives before the client goes quiet, then close
+            self._drain_unsized()
+            self._send_error(411, "Content-Length required", close=True)
+            return
+        length = int(length)
+        if length > self.server.max_upload:
+            self._send_error(413, "Upload too large", close=True)
+            return
+        if url.path != "/convert":
+            # Rejected requests still have their body read and dropped, so a
+            # client that is still sending gets the response, not a reset
+            self._discard_body(length)
+            self._send_error(404, "Not found")
+            return
+        query = parse_qs(url.query)
+        size_str = query.get("size", [ico_core.DEFAULT_ICON_SIZE])[0]
+        all_sizes = query.get("all_sizes", ["0"])[0].lower() in ("1", "true", "yes")
+        resize_mode = query.get("resize", [RESIZE_QUALITY])[0]
+        if resize_mode not in RESIZE_MODES:
+            self._discard_body(length)
+            self._send_error(400, f"Unknown resize mode: {resize_mode}")
+            return
+        if not self.server.try_admit():
+            # Backpressure: refuse now rather than queue without bound. The
+            # body (at most max_upload) is read and dropped first: a client
+            # still uploading would otherwise get a reset instead of the 503,
+            # and the connection stays usable for the retry.
+            count("requests_rejected_total")
+            self._discard_body(length)
+            self._send_error(503, "Server busy", headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+            return
+        try:
+            png_bytes = self.rfile.read(length)
+            start = time.perf_counter()
+            ico_bytes, metrics = self.server.pool.submit(
+                _convert, png_bytes, size_str, all_sizes, resize_mode).result()
+            METRICS.merge(metrics)
+            METRICS.observe("request", time.perf_counter() - start)
+        except ValueError as e:
+            METRICS.count_error(e)
+            self._send_error(400, str(e))
+        except Exception as e:
+            METRICS.count_error(e)
+            log.exception("Conversion failed")
+            self._send_error(500, f"Conversion failed: {e}")
+        else:
+            self._send(200, ico_bytes, ICO_CONTENT_TYPE)
+        finally:
+            self.server.release()
+
+    def _discard_body(self, length):
+        while length > 0:
+            chunk = self.rfile.read(min(length, DISCARD_CHUNK))
+            if not chunk:
+                self.close_connection = True # Client went away mid-upload
+                return
+            length -= len(chunk)
+
+    def _drain_unsized(self):
+        """Drops body bytes of unknown length until the client pauses, up to max_upload."""
+        remaining = self.server.max_upload
+        self.connection.settimeout(DRAIN_TIMEOUT)
+        try:
+            while remaining > 0:
+                chunk = self.rfile.read1(min(remaining, DISCARD_CHUNK))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+        except OSError:
+            pass # Quiet client (timeout) or gone; the connection closes either way
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def _send(self, status, body, content_type, headers=None):
+        count("requests_total", status=status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, close=False, headers=None):
+        if close:
+            self.close_connection = True
+        self._send(status, json.dumps({"error": message}).encode(), "application/json", headers)
+
+    def log_message(self, format, *args):
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, max_queue=None,
+          max_upload=DEFAULT_MAX_UPLOAD):
+    """Runs the server until interrupted."""
+    METRICS.enabled = True
+    server = ConversionServer((host, port), workers, max_queue, max_upload)
+    log.info(f"Serving on http://{host}:{server.server_port} "
+             f"({server.workers} workers, {server.max_queue} requests admitted at once)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# --- Load generator ---
+def load_test(png_path, host=DEFAULT_HOST, port=DEFAULT_PORT, query="", concurrency=8, requests=200,
+              report=print):
+    """Posts `png_path` `requests` times over `concurrency` keep-alive connections.
+
+    A 503 makes that connection wait for its Retry-After before the next
+    request. Connection errors are counted and the connection is reopened.
+    Returns (status counts, latencies of the 200s, connection errors).
+    """
+    with open(png_path, 'rb') as f:
+        body = f.read()
+    target = f"/convert?{query}" if query else "/convert"
+    statuses = {}
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def client():
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        try:
+            while next(remaining, None) is not None:
+                start = time.perf_counter()
+                try:
+                    conn.request("POST", target, body, {"Content-Type": "image/png"})
+                    response = conn.getresponse()
+                    response_body = response.read()
+                except (OSError, http.client.HTTPException) as e:
+                    with lock:
+                        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    conn.close() # Reconnects on the next request
+                    continue
+                elapsed = time.perf_counter() - start
+                with lock:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                    if response.status == 200 and response_body:
+                        latencies.append(elapsed)
+                if response.will_close:
+                    conn.close()
+                retry_after = response.getheader("Retry-After")
+                if response.status == 503 and retry_after and retry_after.isdigit():
+                    time.sleep(int(retry_after))
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(client) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    report(f"{requests} requests in {elapsed:.2f}s ({requests / elapsed:.1f} req/s), "
+           f"status counts {dict(sorted(statuses.items()))}"
+           + (f", connection errors {dict(sorted(errors.items()))}" if errors else ""))
+    if latencies:
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+        report(f"latency median {statistics.median(latencies) * 1000:.1f} ms, "
+               f"p95 {p95 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms")
+    return statuses, latencies, errors
+
+
+# --- Command line ---
+def build_parser():
+    """Builds the argument parser for the serve sub-command."""
+    parser = argparse.ArgumentParser(prog="pngtoico.py serve",
+                                     description="Local HTTP PNG to ICO conversion service.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="Start the server")
+    run_cmd.add_argument("--host", default=DEFAULT_HOST, help="Address to bind (default: %(default)s)")
+    run_cmd.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port (default: %(default)s)")
+    run_cmd.add_argument("-j", "--workers", type=int, default=None,
+                         help="Conversion worker processes (default: CPU count)")
+    run_cmd.add_argument("--max-queue", type=int, default=None,
+                         help="Conversions admitted at once before answering 503 (default: 4 x workers)")
+    run_cmd.add_argument("--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD // (1024 * 1024),
+                         help="Largest accepted PNG upload (default: %(default)s)")
+
+    load_cmd = commands.add_parser("load", help="Load-test a running server")
+    load_cmd.add_argument("png", help="PNG file to upload repeatedly")
+    load_cmd.add_argument("--host", default=DEFAULT_HOST, help="Server address (default: %(default)s)")
+    load_cmd.add_argument("--port", type=int, default=DEFAULT_PORT, help="Server port (default: %(default)s)")
+    load_cmd.add_argument("-c", "--concurrency", type=int, default=8, help="Parallel connections")
+    load_cmd.add_argument("-n", "--requests", type=int, default=200, help="Total requests")
+    load_cmd.add_argument("-q", "--query", default="", help="Conversion options, e.g. 'all_sizes=1'")
+    return parser
+
+
+def main(argv=None):
+    """Command-line entry point. Returns the process exit code."""
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    if args.command == "run":
+        serve(args.host, args.port, args.workers, args.max_queue, args.max_upload_mb * 1024 * 1024)
+        return 0
+    try:
+        statuses, _, errors = load_test(args.png, args.host, args.port, args.query, args.concurrency,
+                                        args.requests)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 0 if set(statuses) <= {200, 503} and not errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
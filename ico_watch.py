@@ -0,0 +1,213 @@
+"""Folder watcher used to pick up new PNGs from Downloads.
+
+On Linux this listens to inotify through ctypes, so new files are seen as
+soon as they are created or renamed into place. Elsewhere (or if inotify is
+unavailable) it falls back to an incremental os.scandir scan that only lists
+the folder when its mtime moves. Either way, a file is only handed out once
+its size and mtime have stopped changing, and every file from a burst is
+reported, oldest first.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from ico_metrics import METRICS, count, log
+
+SCAN_INTERVAL_SECONDS = 0.5   # Fallback scan period (one stat() when nothing changed)
+SETTLE_SECONDS = 0.5          # A file must be unchanged this long before it is reported
+SETTLE_POLL_SECONDS = 0.25    # How often unsettled files are re-checked
+_IDLE_WAIT_SECONDS = 1.0      # Max inotify block so stop() is noticed promptly
+
+# inotify constants from <sys/inotify.h>
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_png(name):
+    return name.lower().endswith('.png')
+
+
+def _list_pngs(folder):
+    """Names of the regular PNG files currently in `folder`."""
+    with os.scandir(folder) as entries:
+        return {e.name for e in entries if _is_png(e.name) and e.is_file()}
+
+
+class ScandirBackend:
+    """Portable backend: rescans the folder only when its mtime has moved."""
+
+    name = "scandir"
+
+    def __init__(self, folder, interval=SCAN_INTERVAL_SECONDS):
+        self.folder = folder
+        self.interval = interval
+        self._dir_mtime_ns = None
+        self._known = set()
+        self._scan() # Files already present at startup are not "new"
+
+    def _scan(self):
+        """Lists the folder and returns PNG names that were not there last time."""
+        # os.stat raises FileNotFoundError if the folder itself disappears
+        self._dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+        current = _list_pngs(self.folder)
+        new_names = current - self._known
+        self._known = current
+        return new_names
+
+    def wait(self, timeout):
+        """Sleeps up to `timeout` seconds and returns any newly appeared PNG names."""
+        time.sleep(min(timeout, self.interval))
+        dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+        # Coarse filesystem timestamps can hide a change made in the same tick
+        # as the previous scan, so keep rescanning while the folder is "fresh".
+        recently_changed = time.time_ns() - dir_mtime_ns < 2_000_000_000
+        if dir_mtime_ns == self._dir_mtime_ns and not recently_changed:
+            return set()
+        return self._scan()
+
+    def close(self):
+        pass
+
+
+class InotifyBackend:
+    """Linux backend: reads create/moved-to/delete events from inotify."""
+
+    name = "inotify"
+
+    def __init__(self, folder):
+        self.folder = folder
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = (_IN_CREATE | _IN_MOVED_TO | _IN_DELETE | _IN_MOVED_FROM
+                | _IN_DELETE_SELF | _IN_MOVE_SELF)
+        if libc.inotify_add_watch(self._fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+        self._rescan_needed = False
+        # Only needed to work out what is new after a queue overflow
+        self._known = _list_pngs(folder)
+
+    def wait(self, timeout):
+        """Blocks up to `timeout` seconds and returns PNG names created in that time."""
+        if self._rescan_needed:
+            # The kernel queue overflowed and events were lost; diff a full listing
+            self._rescan_needed = False
+            current = _list_pngs(self.folder)
+            new_names = current - self._known
+            self._known = current
+            return new_names
+
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            raw_name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                raise FileNotFoundError(f"Watched folder went away: {self.folder}")
+            if mask & _IN_Q_OVERFLOW:
+                self._rescan_needed = True
+                continue
+            name = os.fsdecode(raw_name)
+            if not name or not _is_png(name):
+                continue
+            if mask & (_IN_DELETE | _IN_MOVED_FROM):
+                self._known.discard(name)
+                names.discard(name)
+            else:
+                self._known.add(name)
+                names.add(name)
+        return names
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_backend(folder):
+    """Returns the best available backend for `folder`."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyBackend(folder)
+        except (OSError, AttributeError) as e:
+            # AttributeError: libc without inotify symbols (e.g. some containers)
+            log.info(f"inotify unavailable ({e}), falling back to folder scanning.")
+    return ScandirBackend(folder)
+
+
+class FolderWatcher:
+    """Reports each new, fully written PNG in `folder` to `on_new_file(path)`."""
+
+    def __init__(self, folder, on_new_file, backend=None, settle_seconds=SETTLE_SECONDS):
+        self.folder = folder
+        self.on_new_file = on_new_file
+        self.backend = backend or create_backend(folder)
+        self.settle_seconds = settle_seconds
+        self._pending = {}    # name -> (size, mtime_ns, last change, first seen) in monotonic time
+        self._stopped = False
+
+    def stop(self):
+        """Asks run() to return after its current wait."""
+        self._stopped = True
+
+    def run(self):
+        """Watches until stop() is called. Raises FileNotFoundError if the folder vanishes."""
+        try:
+            while not self._stopped:
+                timeout = SETTLE_POLL_SECONDS if self._pending else _IDLE_WAIT_SECONDS
+                for name in self.backend.wait(timeout):
+                    now = time.monotonic()
+                    self._pending.setdefault(name, (None, None, now, now))
+                if self._pending:
+                    for path in self._collect_settled():
+                        self.on_new_file(path)
+        finally:
+            self.backend.close()
+
+    def _collect_settled(self):
+        """Returns paths whose size/mtime held still for settle_seconds, oldest first."""
+        now = time.monotonic()
+        settled = []
+        for name, (size, mtime_ns, changed_at, first_seen) in list(self._pending.items()):
+            path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                # Temporary file renamed away or deleted before it settled
+                del self._pending[name]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[name] = (st.st_size, st.st_mtime_ns, now, first_seen)
+            elif st.st_size > 0 and now - changed_at >= self.settle_seconds:
+                del self._pending[name]
+                settled.append((st.st_mtime_ns, name, path))
+                # Time spent waiting for the download to finish writing
+                METRICS.observe("settle", now - first_seen)
+                count("files_seen_total")
+        return [path for _, _, path in sorted(settled)]